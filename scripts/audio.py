@@ -0,0 +1,287 @@
+import glob
+import os
+import time
+from collections import OrderedDict, deque
+from queue import Queue
+from threading import Lock, Thread
+
+import bge
+from bge.types import KX_GameObject, KX_Scene
+import aud
+
+SOUND_EXTENSIONS = (".wav", ".mp3", ".ogg", ".flac", ".m4a")
+
+# Simultaneous handles allowed per sound before the oldest one is stolen
+DEFAULT_MAX_VOICES = 4
+# Decoded buffers kept in memory before the least recently used ones are dropped
+DEFAULT_MEMORY_CAP = 64 * 1024 * 1024
+
+# Sounds longer than this (seconds) are streamed from disk in chunks instead of buffered
+STREAM_MIN_DURATION = 20.0
+
+DEFAULT_MUSIC_FADE = 2.0
+
+# Rough decoded/encoded size ratio, used when aud can't tell us the sample count
+COMPRESSED_SIZE_FACTOR = 10
+# Assumed data rates for guessing a duration from the file size, same fallback case
+COMPRESSED_BYTES_PER_SECOND = 128 * 1000 // 8
+WAV_BYTES_PER_SECOND = 44100 * 2 * 2
+
+
+def cacheKey(path: str) -> str:
+    """ One key per file, however the path was spelled. """
+    return os.path.normcase(os.path.abspath(path))
+
+
+def estimateBufferBytes(path: str, sound) -> int:
+    """ Best guess at how much memory a buffered sound takes. """
+    if hasattr(sound, "length") and hasattr(sound, "specs"):
+        # Buffered samples are stored as 32-bit floats
+        return sound.length * sound.specs[1] * 4
+
+    fileSize = os.path.getsize(path)
+    if path.lower().endswith(".wav"):
+        return fileSize
+    return fileSize * COMPRESSED_SIZE_FACTOR
+
+
+def estimateDuration(path: str, sound) -> float:
+    """ Length of a sound in seconds, from its sample count when aud knows it. """
+    if hasattr(sound, "length") and hasattr(sound, "specs") and sound.length > 0:
+        return sound.length / sound.specs[0]
+
+    fileSize = os.path.getsize(path)
+    if path.lower().endswith(".wav"):
+        return fileSize / WAV_BYTES_PER_SECOND
+    return fileSize / COMPRESSED_BYTES_PER_SECOND
+
+
+def shouldStream(path: str, sound) -> bool:
+    """ Long assets (music) are decoded in chunks while playing rather than held in RAM. """
+    return estimateDuration(path, sound) >= STREAM_MIN_DURATION
+
+
+class AudioManager:
+    """ Owns the aud device, a buffer cache filled by a worker thread and per-sound voice limits.
+    Long assets are streamed, and music tracks crossfade without blocking the logic frame. """
+
+    def __init__(self, maxVoices: int = DEFAULT_MAX_VOICES,
+                 memoryCap: int = DEFAULT_MEMORY_CAP) -> None:
+        self.device = aud.device()
+        self.device.distance_model = aud.AUD_DISTANCE_MODEL_LINEAR
+
+        self.maxVoices = maxVoices
+        self.memoryCap = memoryCap
+
+        # Every path below is a cacheKey()
+        # path -> buffered factory, ordered from least to most recently played
+        self.buffers: OrderedDict[str, aud.Factory] = OrderedDict()
+        self.bufferBytes: dict[str, int] = {}
+        self.memoryUsed = 0
+        self.lock = Lock()
+
+        # path -> unbuffered factory for assets that are streamed from disk
+        self.streams: dict[str, aud.Factory] = {}
+
+        self.voices: dict[str, deque] = {}
+        self.listenerScene: KX_Scene | None = None
+        self.updateScene: KX_Scene | None = None
+
+        self.music = None
+        self.musicPath: str | None = None
+        # [handle, startVolume, endVolume, startTime, duration, stopWhenDone]
+        self.fades: list[list] = []
+
+        # One worker for the manager's lifetime, it blocks on the queue between batches
+        self.loadQueue: Queue[str] = Queue()
+        # Paths queued or being decoded, so they aren't queued twice
+        self.pending: set[str] = set()
+        self.loaderThread: Thread | None = None
+
+        bge.logic.audioManager = self
+
+    def preload(self, paths: list[str]):
+        """ Decode sounds on a worker thread so the first play doesn't stall the logic frame. """
+        with self.lock:
+            for path in paths:
+                path = cacheKey(path)
+                if path in self.buffers or path in self.streams or path in self.pending:
+                    continue
+                self.pending.add(path)
+                self.loadQueue.put(path)
+
+        if self.loaderThread is None:
+            self.loaderThread = Thread(target=self._loadQueued, daemon=True)
+            self.loaderThread.start()
+
+    def preloadDirectory(self, directory: str):
+        paths = [path for path in glob.glob(f"{directory}/**/*", recursive=True)
+                 if path.lower().endswith(SOUND_EXTENSIONS)]
+        self.preload(paths)
+
+    def _loadQueued(self):
+        while True:
+            path = self.loadQueue.get()
+
+            try:
+                sound = aud.Factory(path)
+                if shouldStream(path, sound):
+                    with self.lock:
+                        self.streams[path] = sound
+                        self.pending.discard(path)
+                    continue
+
+                sound = sound.buffer()
+            except aud.error:
+                # The worker has to outlive a bad file, play() reports it when it's used
+                with self.lock:
+                    self.pending.discard(path)
+                continue
+            size = estimateBufferBytes(path, sound)
+
+            with self.lock:
+                self.pending.discard(path)
+                self.buffers[path] = sound
+                self.bufferBytes[path] = size
+                self.memoryUsed += size
+                self._evict()
+
+    def _evict(self):
+        # Caller holds the lock. Playing handles keep their own reference to the buffer.
+        while self.memoryUsed > self.memoryCap and len(self.buffers) > 1:
+            path, _ = self.buffers.popitem(last=False)
+            self.memoryUsed -= self.bufferBytes.pop(path)
+
+    def _getFactory(self, path: str) -> aud.Factory:
+        path = cacheKey(path)
+        with self.lock:
+            if path in self.buffers:
+                self.buffers.move_to_end(path)
+                return self.buffers[path]
+            if path in self.streams:
+                return self.streams[path]
+
+        # Not decoded yet: stream it from disk this time and buffer it in the background
+        self.preload([path])
+        return aud.Factory(path)
+
+    def _claimVoice(self, path: str):
+        voices = self.voices.setdefault(path, deque())
+
+        while len(voices) > 0 and voices[0].status != aud.AUD_STATUS_PLAYING:
+            voices.popleft()
+
+        if len(voices) >= self.maxVoices:
+            # Steal the oldest voice of this sound
+            voices.popleft().stop()
+
+        return voices
+
+    def play(self, path: str, obj: KX_GameObject | None = None, maxDistance: float = 10):
+        """ Play a sound, in 3D at obj's position if given (3D sound only works with mono files). """
+        path = cacheKey(path)
+        voices = self._claimVoice(path)
+
+        handle = self.device.play(self._getFactory(path))
+        voices.append(handle)
+
+        if obj is not None:
+            # Makes the handle behave as a 3D sound
+            handle.relative = False
+            handle.location = obj.worldPosition
+
+            # If sound source is farther from listener than the value below, volume is zero
+            handle.distance_maximum = maxDistance
+
+        return handle
+
+    def playMusic(self, path: str | None, fadeTime: float = DEFAULT_MUSIC_FADE):
+        """ Crossfade from the current music track to path (None just fades out). """
+        if path is not None:
+            path = cacheKey(path)
+        if path == self.musicPath:
+            return
+
+        if self.music is not None:
+            self._fade(self.music, self.music.volume, 0.0, fadeTime, True)
+
+        self.musicPath = path
+        self.music = None
+
+        if path is None:
+            return
+
+        handle = self.device.play(self._getFactory(path))
+        handle.loop_count = -1
+        handle.volume = 0.0
+        self._fade(handle, 0.0, 1.0, fadeTime, False)
+        self.music = handle
+
+    def _fade(self, handle, startVolume: float, endVolume: float, duration: float, stopWhenDone: bool):
+        self.fades = [fade for fade in self.fades if fade[0] is not handle]
+        self.fades.append(
+            [handle, startVolume, endVolume, time.perf_counter(), duration, stopWhenDone])
+
+    def residentMemory(self) -> dict[str, int]:
+        """ Estimated bytes each known asset keeps in RAM (streamed assets hold no decoded buffer). """
+        with self.lock:
+            report = dict(self.bufferBytes)
+            for path in self.streams:
+                report[path] = 0
+
+        return report
+
+    def attachUpdater(self, scene: KX_Scene):
+        """ Run update() on scene's pre_draw. Use a scene that outlives level and title changes. """
+        if self.updateScene is scene:
+            return
+
+        if self.updateScene is not None and not self.updateScene.invalid:
+            self.updateScene.pre_draw.remove(self.update)
+
+        self.updateScene = scene
+        scene.pre_draw.append(self.update)
+
+    def attachListener(self, scene: KX_Scene):
+        """ Follow scene's active camera, the listener is updated once per frame. """
+        self.listenerScene = scene
+        if self.updateScene is None or self.updateScene.invalid:
+            self.attachUpdater(scene)
+
+    def update(self):
+        listenerScene = self.listenerScene
+        if listenerScene is not None and not listenerScene.invalid:
+            camera = listenerScene.active_camera
+            self.device.listener_location = camera.worldPosition
+            self.device.listener_orientation = camera.worldOrientation.to_quaternion()
+
+        if len(self.fades) > 0:
+            self._updateFades()
+
+    def _updateFades(self):
+        now = time.perf_counter()
+        running = []
+
+        for fade in self.fades:
+            handle, startVolume, endVolume, startTime, duration, stopWhenDone = fade
+
+            if duration > 0.0:
+                progress = min(1.0, (now - startTime) / duration)
+            else:
+                progress = 1.0
+
+            handle.volume = startVolume + (endVolume - startVolume) * progress
+
+            if progress < 1.0:
+                running.append(fade)
+            elif stopWhenDone:
+                handle.stop()
+
+        self.fades = running
+
+
+def getAudioManager() -> AudioManager:
+    audioManager = getattr(bge.logic, "audioManager", None)
+    if audioManager is None:
+        audioManager = AudioManager()
+    return audioManager
@@ -0,0 +1,335 @@
+from OpenGL import GL as gl
+
+# Shared UI texture pages: cursors, ImageHelper images and GIF frames all go in here, so
+# consecutive images usually share a texture and imgui keeps them in one draw.
+
+ATLAS_PAGE_SIZE = 1024
+# Images bigger than this on either side get a page of their own (cursors are 260x260)
+ATLAS_MAX_IMAGE_SIZE = 384
+# Edge pixels are repeated this far around every image, linear filtering doesn't bleed neighbours in
+ATLAS_PADDING = 1
+# A full page is repacked instead of opening a new one once this share of it has been freed
+ATLAS_REPACK_FREED = 0.5
+
+
+def pad_pixels(pixels: bytes, width: int, height: int, padding: int) -> bytes:
+    """ RGBA pixels with the edge pixels repeated padding times on every side. """
+    if padding < 1:
+        return pixels
+
+    stride = width * 4
+    rows = []
+    for row in range(height):
+        line = pixels[row * stride:(row + 1) * stride]
+        rows.append(line[:4] * padding + line + line[-4:] * padding)
+    return b"".join(rows[:1] * padding + rows + rows[-1:] * padding)
+
+
+class AtlasRegion:
+    """ One image in an atlas page. Repacking moves it, so hold on to the region and read
+    texture_id/uv0/uv1 when drawing rather than keeping copies. """
+
+    def __init__(self, width: int, height: int) -> None:
+        self.width = width
+        self.height = height
+
+        self.page: AtlasPage | None = None
+        self.x = 0
+        self.y = 0
+        self.uv0 = (0.0, 0.0)
+        self.uv1 = (1.0, 1.0)
+
+    @property
+    def padded_size(self) -> tuple[int, int]:
+        return self.width + ATLAS_PADDING * 2, self.height + ATLAS_PADDING * 2
+
+    @property
+    def texture_id(self) -> int:
+        if self.page is None:
+            return 0
+        return self.page.texture
+
+    def place(self, page: "AtlasPage", x: int, y: int):
+        self.page = page
+        self.x = x
+        self.y = y
+
+        left = x + ATLAS_PADDING
+        top = y + ATLAS_PADDING
+        self.uv0 = (left / page.width, top / page.height)
+        self.uv1 = ((left + self.width) / page.width, (top + self.height) / page.height)
+
+    def map_uv(self, uv) -> tuple[float, float]:
+        """ A UV in image space (0-1 across this image) as a UV in the page. """
+        u, v = uv
+        return (self.uv0[0] + (self.uv1[0] - self.uv0[0]) * u,
+                self.uv0[1] + (self.uv1[1] - self.uv0[1]) * v)
+
+
+class AtlasPage:
+    """ One RGBA texture filled with shelves: rows as tall as the first image put in them,
+    filled left to right. A page that isn't shared holds exactly one oversized image. """
+
+    def __init__(self, width: int, height: int, shared: bool = True) -> None:
+        self.width = width
+        self.height = height
+        self.shared = shared
+        self.texture = 0
+
+        # [y, height, next free x]
+        self.shelves: list[list[int]] = []
+        self.top = 0
+
+        self.regions: set[AtlasRegion] = set()
+        # Padded pixels handed out since the last reset / still in use
+        self.allocated = 0
+        self.used = 0
+
+    @property
+    def freed(self) -> int:
+        return self.allocated - self.used
+
+    def create(self):
+        self.texture = gl.glGenTextures(1)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self.texture)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP_TO_EDGE)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, gl.GL_CLAMP_TO_EDGE)
+        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA, self.width, self.height, 0,
+                        gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, None)
+
+    def allocate(self, width: int, height: int) -> tuple[int, int] | None:
+        if width > self.width or height > self.height:
+            return None
+
+        # Shortest shelf the image fits on, so small icons don't eat tall rows
+        best = None
+        for shelf in self.shelves:
+            if shelf[1] >= height and shelf[2] + width <= self.width:
+                if best is None or shelf[1] < best[1]:
+                    best = shelf
+
+        if best is None:
+            if self.top + height > self.height:
+                return None
+            best = [self.top, height, 0]
+            self.shelves.append(best)
+            self.top += height
+
+        x = best[2]
+        best[2] += width
+        self.allocated += width * height
+        return x, best[0]
+
+    def add(self, region: AtlasRegion, x: int, y: int):
+        region.place(self, x, y)
+        self.regions.add(region)
+        width, height = region.padded_size
+        self.used += width * height
+
+    def upload(self, region: AtlasRegion, pixels: bytes):
+        """ Write region's padded pixels where it was added. """
+        width, height = region.padded_size
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self.texture)
+        gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, region.x, region.y, width, height,
+                           gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, pixels)
+
+    def remove(self, region: AtlasRegion):
+        self.regions.discard(region)
+        width, height = region.padded_size
+        self.used -= width * height
+        region.page = None
+
+    def reset(self):
+        """ Forget the layout, the texture is kept and simply written over. """
+        self.shelves.clear()
+        self.top = 0
+        self.allocated = 0
+
+    def destroy(self):
+        if self.texture:
+            gl.glDeleteTextures([self.texture])
+            self.texture = 0
+
+
+class TextureAtlas:
+    """ Packs small UI images into shared pages as they're added. Nothing already placed
+    moves, except when a full page with lots of freed space is repacked. Pixels only live on
+    the GPU, a repack copies them texture to texture. """
+
+    def __init__(self, page_size: int = ATLAS_PAGE_SIZE, max_image_size: int = ATLAS_MAX_IMAGE_SIZE) -> None:
+        self.page_size = page_size
+        self.max_image_size = max_image_size
+        # Off: every image gets a page of its own, like a plain texture
+        self.enabled = True
+
+        self.pages: list[AtlasPage] = []
+        self.repacks = 0
+
+        # Whether glCopyImageSubData (GL 4.3) is there, checked on the first repack.
+        # Without it repacks blit between these two framebuffers
+        self.copy_image: bool | None = None
+        self.copy_framebuffers: list[int] = []
+
+    def add(self, pixels: bytes, width: int, height: int) -> AtlasRegion:
+        return self.add_frames([pixels], width, height)[0]
+
+    def add_frames(self, frames: list[bytes], width: int, height: int) -> list[AtlasRegion]:
+        """ Place same-sized images (e.g. GIF frames), the current texture binding is kept. """
+        last_texture = gl.glGetIntegerv(gl.GL_TEXTURE_BINDING_2D)
+
+        shared = self.enabled and width <= self.max_image_size and height <= self.max_image_size
+        regions = []
+        for pixels in frames:
+            region = AtlasRegion(width, height)
+            if shared:
+                self._place(region)
+            else:
+                self._place_alone(region)
+            region.page.upload(region, pad_pixels(pixels, width, height, ATLAS_PADDING))
+            regions.append(region)
+
+        gl.glBindTexture(gl.GL_TEXTURE_2D, last_texture)
+        return regions
+
+    def release(self, region: AtlasRegion):
+        page = region.page
+        if page is None:
+            return
+
+        page.remove(region)
+        if len(page.regions) > 0:
+            return
+
+        if page.shared:
+            page.reset()
+        else:
+            page.destroy()
+            self.pages.remove(page)
+
+    def _place(self, region: AtlasRegion):
+        width, height = region.padded_size
+        for page in self.pages:
+            if page.shared and (spot := page.allocate(width, height)) is not None:
+                page.add(region, *spot)
+                return
+
+        pages = [page for page in self.pages if page.shared]
+        if len(pages) > 0:
+            page = max(pages, key=lambda page: page.freed)
+            if page.freed >= page.width * page.height * ATLAS_REPACK_FREED:
+                self._repack(page)
+                if (spot := page.allocate(width, height)) is not None:
+                    page.add(region, *spot)
+                    return
+
+        page = AtlasPage(self.page_size, self.page_size)
+        page.create()
+        self.pages.append(page)
+        page.add(region, *page.allocate(width, height))
+
+    def _place_alone(self, region: AtlasRegion):
+        width, height = region.padded_size
+        page = AtlasPage(width, height, shared=False)
+        page.create()
+        self.pages.append(page)
+        page.add(region, *page.allocate(width, height))
+
+    def _repack(self, page: AtlasPage):
+        """ Lay the page's live images out again from scratch, tallest first, in a fresh
+        texture they're copied into from the old one. """
+        regions = sorted(page.regions, key=lambda region: region.height, reverse=True)
+        # Where each image is in the old texture
+        sources = [(region, region.x, region.y) for region in regions]
+        for region in regions:
+            page.remove(region)
+        page.reset()
+
+        old_texture = page.texture
+        page.create()
+
+        leftover = []
+        for region, x, y in sources:
+            spot = page.allocate(*region.padded_size)
+            if spot is None:
+                leftover.append((region, x, y))
+            else:
+                page.add(region, *spot)
+                self._copy(old_texture, x, y, region)
+
+        # Shelves can pack worse than before, anything that no longer fits moves on
+        for region, x, y in leftover:
+            self._place(region)
+            self._copy(old_texture, x, y, region)
+
+        gl.glDeleteTextures([old_texture])
+        self.repacks += 1
+
+    def _copy(self, source: int, x: int, y: int, region: AtlasRegion):
+        """ Copy region's padded pixels from (x, y) in the source texture to where it is now. """
+        width, height = region.padded_size
+        if self.copy_image is None:
+            self.copy_image = bool(gl.glCopyImageSubData)
+
+        if self.copy_image:
+            gl.glCopyImageSubData(source, gl.GL_TEXTURE_2D, 0, x, y, 0,
+                                  region.texture_id, gl.GL_TEXTURE_2D, 0, region.x, region.y, 0,
+                                  width, height, 1)
+            return
+
+        if len(self.copy_framebuffers) < 1:
+            self.copy_framebuffers = list(gl.glGenFramebuffers(2))
+        read_framebuffer, draw_framebuffer = self.copy_framebuffers
+
+        last_read = gl.glGetIntegerv(gl.GL_READ_FRAMEBUFFER_BINDING)
+        last_draw = gl.glGetIntegerv(gl.GL_DRAW_FRAMEBUFFER_BINDING)
+        scissor = gl.glIsEnabled(gl.GL_SCISSOR_TEST)
+
+        gl.glBindFramebuffer(gl.GL_READ_FRAMEBUFFER, read_framebuffer)
+        gl.glFramebufferTexture2D(gl.GL_READ_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0,
+                                  gl.GL_TEXTURE_2D, source, 0)
+        gl.glBindFramebuffer(gl.GL_DRAW_FRAMEBUFFER, draw_framebuffer)
+        gl.glFramebufferTexture2D(gl.GL_DRAW_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0,
+                                  gl.GL_TEXTURE_2D, region.texture_id, 0)
+        # The blit is clipped by the scissor test like a draw
+        gl.glDisable(gl.GL_SCISSOR_TEST)
+
+        gl.glBlitFramebuffer(x, y, x + width, y + height,
+                             region.x, region.y, region.x + width, region.y + height,
+                             gl.GL_COLOR_BUFFER_BIT, gl.GL_NEAREST)
+
+        # Let go of the textures, the old page is deleted after the repack
+        gl.glFramebufferTexture2D(gl.GL_DRAW_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0,
+                                  gl.GL_TEXTURE_2D, 0, 0)
+        gl.glFramebufferTexture2D(gl.GL_READ_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0,
+                                  gl.GL_TEXTURE_2D, 0, 0)
+
+        if scissor:
+            gl.glEnable(gl.GL_SCISSOR_TEST)
+        gl.glBindFramebuffer(gl.GL_READ_FRAMEBUFFER, last_read)
+        gl.glBindFramebuffer(gl.GL_DRAW_FRAMEBUFFER, last_draw)
+
+    @property
+    def image_count(self) -> int:
+        return sum(len(page.regions) for page in self.pages)
+
+    @property
+    def fill(self) -> float:
+        """ Share of the shared pages' pixels that live images cover. """
+        pages = [page for page in self.pages if page.shared]
+        if len(pages) == 0:
+            return 0.0
+        return sum(page.used for page in pages) / sum(page.width * page.height for page in pages)
+
+    def destroy(self):
+        for page in self.pages:
+            page.destroy()
+        self.pages.clear()
+
+        if len(self.copy_framebuffers) > 0:
+            gl.glDeleteFramebuffers(2, self.copy_framebuffers)
+            self.copy_framebuffers = []
+
+
+ui_atlas = TextureAtlas()
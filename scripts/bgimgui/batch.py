@@ -0,0 +1,67 @@
+import imgui
+
+# Pure python like stream.py's fingerprinting, the GL calls stay in the renderers
+
+
+class DrawStats:
+    """ imgui commands against the draws actually issued for them, for the last frame drawn
+    and in total. Dear ImGui already merges adjacent commands with the same clip rect and
+    texture inside a draw list, so this stays near 0 unless something else splits them. """
+
+    def __init__(self) -> None:
+        self.frame_commands = 0
+        self.frame_draws = 0
+        self.commands = 0
+        self.draws = 0
+
+    def begin_frame(self):
+        self.frame_commands = 0
+        self.frame_draws = 0
+
+    def add(self, commands: int, draws: int):
+        self.frame_commands += commands
+        self.frame_draws += draws
+        self.commands += commands
+        self.draws += draws
+
+    @property
+    def saved(self) -> float:
+        """ Share of draw calls merging saved overall. """
+        if self.commands == 0:
+            return 0.0
+        return 1.0 - self.draws / self.commands
+
+
+def coalesce_commands(commands, fb_height: int, index_offset: int = 0,
+                      stats: DrawStats | None = None) -> list[list]:
+    """ Merge runs of adjacent commands with the same texture and clip rect into one draw,
+    their indices are contiguous so the element counts just add up.
+    Returns [texture_id, scissor box, element count, index byte offset] per draw. """
+    draws = []
+    last = None
+    last_texture = None
+    last_clip = None
+    index_size = imgui.INDEX_SIZE
+    count = 0
+
+    for command in commands:
+        count += 1
+        elem_count = command.elem_count
+        texture_id = command.texture_id
+        clip = command.clip_rect
+
+        if last is not None and texture_id == last_texture and clip == last_clip:
+            last[2] += elem_count
+        else:
+            x, y, z, w = clip
+            last = [texture_id, (int(x), int(fb_height - w), int(z - x), int(w - y)),
+                    elem_count, index_offset]
+            draws.append(last)
+            last_texture = texture_id
+            last_clip = clip
+
+        index_offset += elem_count * index_size
+
+    if stats is not None:
+        stats.add(count, len(draws))
+    return draws
@@ -0,0 +1,215 @@
+from OpenGL import GL as gl
+
+# No bge in here either, a GLStateCache can be checked against any GL context
+
+# Passes between validate() runs in debug builds
+DEBUG_VALIDATE_INTERVAL = 60
+
+
+def _ints(value):
+    if hasattr(value, "__len__"):
+        return tuple(int(item) for item in value)
+    return int(value)
+
+
+def _query_int(pname):
+    return lambda: _ints(gl.glGetIntegerv(pname))
+
+
+def _query_ints(*pnames):
+    return lambda: tuple(_ints(gl.glGetIntegerv(pname)) for pname in pnames)
+
+
+def _query_polygon_mode():
+    mode = _ints(gl.glGetIntegerv(gl.GL_POLYGON_MODE))
+    if isinstance(mode, tuple):
+        return mode[0]
+    return mode
+
+
+def _query_clear_color():
+    return tuple(float(item) for item in gl.glGetFloatv(gl.GL_COLOR_CLEAR_VALUE))
+
+
+# key -> (query the real value, apply a value)
+STATE_FUNCTIONS = {
+    "texture": (_query_int(gl.GL_TEXTURE_BINDING_2D),
+                lambda value: gl.glBindTexture(gl.GL_TEXTURE_2D, value)),
+    "viewport": (_query_int(gl.GL_VIEWPORT),
+                 lambda value: gl.glViewport(*value)),
+    "scissor": (_query_int(gl.GL_SCISSOR_BOX),
+                lambda value: gl.glScissor(*value)),
+    "blend_func": (_query_ints(gl.GL_BLEND_SRC_RGB, gl.GL_BLEND_DST_RGB,
+                               gl.GL_BLEND_SRC_ALPHA, gl.GL_BLEND_DST_ALPHA),
+                   lambda value: gl.glBlendFuncSeparate(*value)),
+    "blend_equation": (_query_ints(gl.GL_BLEND_EQUATION_RGB, gl.GL_BLEND_EQUATION_ALPHA),
+                       lambda value: gl.glBlendEquationSeparate(*value)),
+    "polygon_mode": (_query_polygon_mode,
+                     lambda value: gl.glPolygonMode(gl.GL_FRONT_AND_BACK, value)),
+    "program": (_query_int(gl.GL_CURRENT_PROGRAM),
+                lambda value: gl.glUseProgram(value)),
+    "active_texture": (_query_int(gl.GL_ACTIVE_TEXTURE),
+                       lambda value: gl.glActiveTexture(value)),
+    "array_buffer": (_query_int(gl.GL_ARRAY_BUFFER_BINDING),
+                     lambda value: gl.glBindBuffer(gl.GL_ARRAY_BUFFER, value)),
+    "vertex_array": (_query_int(gl.GL_VERTEX_ARRAY_BINDING),
+                     lambda value: gl.glBindVertexArray(value)),
+    "draw_framebuffer": (_query_int(gl.GL_DRAW_FRAMEBUFFER_BINDING),
+                         lambda value: gl.glBindFramebuffer(gl.GL_DRAW_FRAMEBUFFER, value)),
+    "clear_color": (_query_clear_color,
+                    lambda value: gl.glClearColor(*value)),
+}
+
+
+def _capability_functions(capability):
+    return (lambda: bool(gl.glIsEnabled(capability)),
+            lambda value: gl.glEnable(capability) if value else gl.glDisable(capability))
+
+
+def _functions(key):
+    functions = STATE_FUNCTIONS.get(key)
+    if functions is None:
+        # ("enable", capability)
+        functions = _capability_functions(key[1])
+        STATE_FUNCTIONS[key] = functions
+    return functions
+
+
+class GLStateCache:
+    """ Shadow copy of the GL state the UI pass touches, replacing a glGet save and full restore
+    around every pass. A piece of host state is queried the first time a pass changes it, after
+    that calls that wouldn't change anything are skipped and end() puts back only what changed.
+
+    The host state is kept across passes, end() leaves GL the way the next pass expects it.
+    The pieces BGE changes between passes are followed explicitly: the framebuffer it draws
+    into with refresh(), and its viewport with invalidate() when the window is resized.
+    validate() compares the cache with real queries, every validate_interval passes when
+    that's set, and catches anything else the host changed. """
+
+    def __init__(self, validate_interval: int = 0) -> None:
+        # key -> value before the UI pass / value GL has right now
+        self.host: dict = {}
+        self.current: dict = {}
+        # Keys changed this pass, in the order they were first changed
+        self.touched: dict = {}
+
+        self.validate_interval = validate_interval
+        self.frame = 0
+
+        self.queries = 0
+        self.calls = 0
+        self.skipped = 0
+        self.mismatches: list[tuple] = []
+
+    def value(self, key):
+        """ What GL has for key right now, queried only if the cache hasn't seen it yet. """
+        if key not in self.host:
+            self.queries += 1
+            host_value = _functions(key)[0]()
+            self.host[key] = host_value
+            self.current[key] = host_value
+        return self.current[key]
+
+    def refresh(self, key):
+        """ Query key again even if it's cached, for host state that may change between passes
+        (e.g. the framebuffer BGE draws into). State the pass already changed keeps its value. """
+        if key not in self.touched:
+            self.host.pop(key, None)
+            self.current.pop(key, None)
+        return self.value(key)
+
+    def _set(self, key, value):
+        if self.value(key) == value:
+            self.skipped += 1
+            return
+
+        _functions(key)[1](value)
+        self.calls += 1
+        self.current[key] = value
+        if key not in self.touched:
+            self.touched[key] = True
+
+    def begin(self):
+        self.frame += 1
+        self.touched.clear()
+
+    def end(self):
+        """ Restore the host's value of everything changed since begin(), newest first
+        (so a texture binding goes back while its texture unit is still active). """
+        if self.validate_interval > 0 and self.frame % self.validate_interval == 0:
+            self.validate()
+
+        for key in reversed(list(self.touched)):
+            host_value = self.host[key]
+            if self.current[key] != host_value:
+                _functions(key)[1](host_value)
+                self.calls += 1
+                self.current[key] = host_value
+        self.touched.clear()
+
+    def invalidate(self):
+        self.host.clear()
+        self.current.clear()
+        self.touched.clear()
+
+    def validate(self) -> list[tuple]:
+        """ Query every cached piece of state and compare it with what the cache believes.
+        Mismatches are recorded as (key, cached, real) and the cache is corrected, a key changed
+        behind the cache's back during a pass is put back by end() like any other. """
+        mismatches = []
+        for key, cached in list(self.current.items()):
+            real = _functions(key)[0]()
+            self.queries += 1
+            if real != cached:
+                mismatches.append((key, cached, real))
+                self.current[key] = real
+                if key not in self.touched:
+                    self.touched[key] = True
+
+        self.mismatches.extend(mismatches)
+        return mismatches
+
+    def enable(self, capability):
+        self._set(("enable", capability), True)
+
+    def disable(self, capability):
+        self._set(("enable", capability), False)
+
+    def bind_texture(self, texture):
+        self._set("texture", texture)
+
+    def viewport(self, x, y, width, height):
+        self._set("viewport", (x, y, width, height))
+
+    def scissor(self, x, y, width, height):
+        self._set("scissor", (x, y, width, height))
+
+    def blend_func(self, src, dst):
+        self._set("blend_func", (src, dst, src, dst))
+
+    def blend_func_separate(self, src_rgb, dst_rgb, src_alpha, dst_alpha):
+        self._set("blend_func", (src_rgb, dst_rgb, src_alpha, dst_alpha))
+
+    def blend_equation(self, mode):
+        self._set("blend_equation", (mode, mode))
+
+    def polygon_mode(self, mode):
+        self._set("polygon_mode", mode)
+
+    def use_program(self, program):
+        self._set("program", program)
+
+    def active_texture(self, unit):
+        self._set("active_texture", unit)
+
+    def bind_array_buffer(self, buffer):
+        self._set("array_buffer", buffer)
+
+    def bind_vertex_array(self, vertex_array):
+        self._set("vertex_array", vertex_array)
+
+    def bind_draw_framebuffer(self, framebuffer):
+        self._set("draw_framebuffer", framebuffer)
+
+    def clear_color(self, red, green, blue, alpha):
+        self._set("clear_color", (red, green, blue, alpha))
@@ -1,14 +1,16 @@
-from PIL import Image, ImageSequence, UnidentifiedImageError
+from PIL import Image, ImageSequence
 from OpenGL import GL as gl
 import pathlib
 import imgui
 
+from .atlas import AtlasRegion, ui_atlas
+from .loader import PRIORITY_PRELOAD, PRIORITY_VISIBLE, image_loader
+
 _dummy_texture_id = None
 
 
 def dummy_texture_id():
     global _dummy_texture_id
-    _dummy_texture_id = None
     if _dummy_texture_id is None:
         _dummy_texture_id = gl.glGenTextures(1)
         gl.glBindTexture(gl.GL_TEXTURE_2D, _dummy_texture_id)
@@ -42,7 +44,8 @@ class ImageHelper:
         self.animated = False
         self.frames: list[bytes] = []
         self.durations: list[float] = []
-        self.texture_ids: list[int] = []
+        # One atlas region per frame, see atlas.py
+        self.regions: list[AtlasRegion] = []
         self.resolved_path: pathlib.Path = None
         self.path: pathlib.Path = pathlib.Path(path)
         self.resolve()
@@ -81,7 +84,9 @@ class ImageHelper:
 
         try:
             image = Image.open(self.resolved_path)
-        except UnidentifiedImageError:
+        except OSError:
+            # UnidentifiedImageError or an unreadable file. This usually runs on a loader
+            # thread where nothing would see the exception, so the image is just invalid
             self.invalid = True
             self.loaded = True
             self.loading = False
@@ -100,47 +105,51 @@ class ImageHelper:
         self.loaded = True
         self.loading = False
 
+    def release(self):
+        for region in self.regions:
+            ui_atlas.release(region)
+        self.regions.clear()
+
     def apply(self):
-        if self.texture_ids:
-            gl.glDeleteTextures([self.texture_ids])
-            self.texture_ids.clear()
-        texture_gen = gl.glGenTextures(len(self.frames))
-        self.texture_ids.extend([texture_gen] if len(
-            self.frames) == 1 else texture_gen)
-        for frame, texture_id in zip(self.frames, self.texture_ids):
-            gl.glBindTexture(gl.GL_TEXTURE_2D, texture_id)
-            gl.glTexParameteri(
-                gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
-            gl.glTexParameteri(
-                gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
-            gl.glTexParameteri(
-                gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP_TO_BORDER)
-            gl.glTexParameteri(
-                gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, gl.GL_CLAMP_TO_BORDER)
-            gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA, self.width,
-                            self.height, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, frame)
+        # Small images and all their frames share atlas pages, big ones get a page each
+        self.release()
+        self.regions.extend(ui_atlas.add_frames(self.frames, self.width, self.height))
         self.frames.clear()
         self.applied = True
 
+    def preload(self, priority: int = PRIORITY_PRELOAD):
+        """ Start decoding in the background before the image is first shown. """
+        if not self.loaded and not self.loading:
+            self.loading = True
+            self.applied = False
+            image_loader.request(self, priority)
+
     @property
     def texture_id(self):
         if not self.loaded:
-            if not self.loading:
+            if image_loader.draining:
+                # Decoded on a loader thread and uploaded by image_loader.drain(). Asking again
+                # every frame it's shown moves a preloaded image up to visible priority.
+                self.loading = True
+                self.applied = False
+                image_loader.request(self, PRIORITY_VISIBLE)
+            elif not self.loading:
+                # Nothing drains the loader (no BGEImguiWrapper), decode it right here
                 self.loading = True
                 self.applied = False
-                # This next self.reload() actually loads the image and does all the conversion. It takes time and resources!
                 self.reload()
-                # You can (and maybe should) run this in a thread! threading.Thread(target=self.reload, daemon=True).start()
-                # Or maybe setup an image thread and queue images to load one by one?
-                # You could do this with https://gist.github.com/Willy-JL/bb410bcc761f8bf5649180f22b7f3b44 like so:
-                # sync_thread.queue(self.reload)
             return dummy_texture_id()
 
         if self.missing or self.invalid:
             return dummy_texture_id()
 
         if not self.applied:
-            self.apply()
+            if not image_loader.draining:
+                # Uploading now could repack an atlas page under images already drawn this
+                # frame, it waits for the end of the frame (ImageLoader.flush)
+                image_loader.defer(self)
+            # Decoded, waiting for an upload slot
+            return dummy_texture_id()
 
         if self.animated:
             if self.prev_time != (new_time := imgui.get_time()):
@@ -152,22 +161,42 @@ class ImageHelper:
                     if self.frame == len(self.durations) - 1:
                         self.frame = 0
 
-        return self.texture_ids[self.frame]
+        return self.regions[self.frame].texture_id
+
+    def uv_rect(self, uv0=(0.0, 0.0), uv1=(1.0, 1.0)):
+        """ UVs in image space (like crop_to_ratio() returns) mapped into the current frame's
+        atlas page, read texture_id first so the frame is up to date. """
+        if not self.applied or not self.regions:
+            return uv0, uv1
+        region = self.regions[self.frame]
+        return region.map_uv(uv0), region.map_uv(uv1)
+
+    def _atlas_args(self, args, kwargs, uv_names=("uv0", "uv1")):
+        """ render()'s uv arguments, positional or keyword, passed through uv_rect(). """
+        if not self.applied or not self.regions:
+            return args, kwargs
+        args = list(args)
+        uv0 = args[0] if len(args) > 0 else kwargs.pop(uv_names[0], (0.0, 0.0))
+        uv1 = args[1] if len(args) > 1 else kwargs.pop(uv_names[1], (1.0, 1.0))
+        return [*self.uv_rect(uv0, uv1), *args[2:]], kwargs
 
     def render(self, width: int, height: int, *args, **kwargs):
         if imgui.is_rect_visible(width, height):
+            texture_id = self.texture_id
             if "rounding" in kwargs:
                 flags = kwargs.pop("flags", None)
                 if flags is None:
                     flags = imgui.DRAW_ROUND_CORNERS_ALL
+                args, kwargs = self._atlas_args(args, kwargs, ("uv_a", "uv_b"))
                 pos = imgui.get_cursor_screen_pos()
                 pos2 = (pos.x + width, pos.y + height)
                 draw_list = imgui.get_window_draw_list()
-                draw_list.add_image_rounded(self.texture_id, tuple(
+                draw_list.add_image_rounded(texture_id, tuple(
                     pos), pos2, *args, flags=flags, **kwargs)
                 imgui.dummy(width, height)
             else:
-                imgui.image(self.texture_id, width, height, *args, **kwargs)
+                args, kwargs = self._atlas_args(args, kwargs)
+                imgui.image(texture_id, width, height, *args, **kwargs)
             return True
         else:
             # Skip if outside view
@@ -175,6 +204,7 @@ class ImageHelper:
             return False
 
     def crop_to_ratio(self, ratio: int | float, fit=False):
+        """ Image space UVs, render() maps them into the atlas (or use uv_rect()). """
         img_ratio = self.width / self.height
         if (img_ratio >= ratio) != fit:
             crop_h = self.height
@@ -209,20 +239,22 @@ class ForegroundImageHelper(ImageHelper):
         if imgui.is_rect_visible(width, height):
             position = self.image_position
             flags = kwargs.pop("flags", None)
+            texture_id = self.texture_id
+            args, kwargs = self._atlas_args(args, kwargs, ("uv_a", "uv_b"))
             if "rounding" in kwargs:
                 if flags is None:
                     flags = imgui.DRAW_ROUND_CORNERS_ALL
                 pos = position
                 pos2 = (pos[0] + width, pos[1] + height)
                 draw_list = imgui.get_foreground_draw_list()
-                draw_list.add_image_rounded(self.texture_id, tuple(
+                draw_list.add_image_rounded(texture_id, tuple(
                     pos), pos2, *args, flags=flags, **kwargs)
 
             else:
                 pos = position
                 pos2 = (pos[0] + width, pos[1] + height)
                 draw_list = imgui.get_foreground_draw_list()
-                draw_list.add_image(self.texture_id, tuple(
+                draw_list.add_image(texture_id, tuple(
                     pos), pos2, *args, **kwargs)
 
             return True
@@ -244,20 +276,22 @@ class BackgroundImageHelper(ImageHelper):
         if imgui.is_rect_visible(width, height):
             position = self.image_position
             flags = kwargs.pop("flags", None)
+            texture_id = self.texture_id
+            args, kwargs = self._atlas_args(args, kwargs, ("uv_a", "uv_b"))
             if "rounding" in kwargs:
                 if flags is None:
                     flags = imgui.DRAW_ROUND_CORNERS_ALL
                 pos = position
                 pos2 = (pos[0] + width, pos[1] + height)
                 draw_list = imgui.get_background_draw_list()
-                draw_list.add_image_rounded(self.texture_id, tuple(
+                draw_list.add_image_rounded(texture_id, tuple(
                     pos), pos2, *args, flags=flags, **kwargs)
 
             else:
                 pos = position
                 pos2 = (pos[0] + width, pos[1] + height)
                 draw_list = imgui.get_background_draw_list()
-                draw_list.add_image(self.texture_id, tuple(
+                draw_list.add_image(texture_id, tuple(
                     pos), pos2, *args, **kwargs)
 
             return True
@@ -351,3 +385,6 @@ if __name__ == "__main__":
             if show_bounding_rect:
                 draw_bounding_rect()
             imgui.end_group()
+
+        # Once your renderer has drawn the frame, upload the images that turned up in it
+        image_loader.flush()
@@ -1,15 +1,17 @@
 import imgui
-from .renderer import BGEImguiRenderer
+from .loader import image_loader
+from .renderer import createImguiRenderer, PIPELINE_AUTO
 from .widgets import GUIWindow
 from bge.types import KX_Scene
 import bge.logic
 
 
 class BGEImguiWrapper:
-    def __init__(self, scene: KX_Scene, cursorPath=None) -> None:
+    def __init__(self, scene: KX_Scene, cursorPath=None, pipeline: str = PIPELINE_AUTO) -> None:
         bge.logic.gui = self
         self.imgui_context = imgui.create_context()
-        self.imgui_backend = BGEImguiRenderer(scene, cursorPath=cursorPath)
+        self.imgui_backend = createImguiRenderer(
+            scene, cursorPath=cursorPath, pipeline=pipeline)
         self.windows: list[GUIWindow] = []
         self.showCursor = True
 
@@ -38,6 +40,9 @@ class BGEImguiWrapper:
         # Update inputs like mouse/keyboard
         backend.updateIO()
 
+        # GL uploads of images decoded in the background, a few ms worth per frame
+        image_loader.drain()
+
         imgui.new_frame()
 
         self.drawGUI()
@@ -51,4 +56,5 @@ class BGEImguiWrapper:
         backend.render(imgui.get_draw_data())
 
     def shutdownGUI(self):
+        image_loader.shutdown()
         self.imgui_backend.shutdown()
@@ -0,0 +1,173 @@
+import heapq
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+# Decoding and RGBA conversion run on worker threads, GL uploads stay on the thread that
+# draws the UI and are spread over frames by drain()
+
+LOADER_WORKERS = 2
+# GL upload time allowed per frame, at least one image is uploaded per drain whatever it costs
+UPLOAD_BUDGET_MS = 2.0
+
+# Lower loads first
+PRIORITY_VISIBLE = 0
+PRIORITY_PRELOAD = 10
+
+
+class ImageLoader:
+    """ Thread pool for ImageHelper.reload(). Requests are ordered by priority rather than
+    arrival: every submitted task decodes whichever image is most urgent at the time it runs,
+    so an image that turns visible overtakes ones queued for preloading. """
+
+    def __init__(self, workers: int = LOADER_WORKERS, budget_ms: float = UPLOAD_BUDGET_MS) -> None:
+        self.workers = workers
+        self.budget_ms = budget_ms
+        self.executor: ThreadPoolExecutor | None = None
+        # Set by the first drain(), until then images load synchronously like they used to
+        self.draining = False
+
+        self.lock = Lock()
+        self.order = itertools.count()
+        # (priority, order, image) waiting for a worker / decoded and waiting for drain()
+        self.pending: list[tuple] = []
+        self.ready: list[tuple] = []
+        # image -> best priority it was requested with, from request() until it's uploaded
+        self.queued: dict = {}
+        self.decoding: set = set()
+        self.decoded_images: set = set()
+        # image -> perf_counter() of its first request, for the request to upload latency
+        self.requested: dict = {}
+        # Images decoded while nothing drains, uploaded by flush() once the frame is drawn
+        self.deferred: list = []
+
+        self.decoded = 0
+        self.uploaded = 0
+        self.decode_ms_total = 0.0
+        self.decode_ms_max = 0.0
+        self.latency_ms_total = 0.0
+        self.latency_ms_max = 0.0
+        self.last_drain_ms = 0.0
+        self.last_drain_uploads = 0
+
+    def request(self, image, priority: int = PRIORITY_VISIBLE):
+        """ Queue image for decoding, or raise its priority if it's already waiting. """
+        with self.lock:
+            queued = self.queued.get(image)
+            if queued is not None and (queued <= priority or image in self.decoding
+                                       or image in self.decoded_images):
+                return
+
+            self.queued[image] = priority
+            self.requested.setdefault(image, time.perf_counter())
+            heapq.heappush(self.pending, (priority, next(self.order), image))
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="image-loader")
+        self.executor.submit(self._decode_next)
+
+    def _decode_next(self):
+        with self.lock:
+            while len(self.pending) > 0:
+                priority, order, image = heapq.heappop(self.pending)
+                # Skip entries left behind by a priority raise
+                if (self.queued.get(image) == priority and image not in self.decoding
+                        and image not in self.decoded_images):
+                    self.decoding.add(image)
+                    break
+            else:
+                return
+
+        start = time.perf_counter()
+        try:
+            image.reload()
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000.0
+            with self.lock:
+                self.decoding.discard(image)
+                self.decoded_images.add(image)
+                self.decoded += 1
+                self.decode_ms_total += elapsed
+                self.decode_ms_max = max(self.decode_ms_max, elapsed)
+                heapq.heappush(self.ready, (priority, order, image))
+
+    def defer(self, image):
+        """ Upload image in the next flush() instead of in the middle of building a frame. """
+        if image not in self.deferred:
+            self.deferred.append(image)
+
+    def flush(self):
+        """ Upload the images defer() was given. Call it once the frame's draw data has been
+        drawn: an upload can repack an atlas page under draws the frame already recorded. """
+        deferred = self.deferred
+        self.deferred = []
+        for image in deferred:
+            if image.loaded and not image.applied and not (image.missing or image.invalid):
+                image.apply()
+
+    def drain(self, budget_ms: float | None = None):
+        """ Upload decoded images, most urgent first, until the frame's budget is spent.
+        Must run on the GL thread, before the frame is built. """
+        self.draining = True
+        # Anything deferred before draining started
+        self.flush()
+        if budget_ms is None:
+            budget_ms = self.budget_ms
+
+        start = time.perf_counter()
+        uploads = 0
+        while True:
+            with self.lock:
+                if len(self.ready) < 1:
+                    break
+                _, _, image = heapq.heappop(self.ready)
+                self.queued.pop(image, None)
+                self.decoded_images.discard(image)
+                requested = self.requested.pop(image, start)
+
+            if image.loaded and not image.applied and not (image.missing or image.invalid):
+                image.apply()
+            uploads += 1
+
+            now = time.perf_counter()
+            latency = (now - requested) * 1000.0
+            self.latency_ms_total += latency
+            self.latency_ms_max = max(self.latency_ms_max, latency)
+            if (now - start) * 1000.0 >= budget_ms:
+                break
+
+        self.uploaded += uploads
+        self.last_drain_uploads = uploads
+        self.last_drain_ms = (time.perf_counter() - start) * 1000.0
+
+    @property
+    def queue_depth(self) -> int:
+        """ Images requested but not uploaded yet. """
+        with self.lock:
+            return len(self.queued)
+
+    @property
+    def waiting_upload(self) -> int:
+        with self.lock:
+            return len(self.ready)
+
+    @property
+    def decode_ms_mean(self) -> float:
+        if self.decoded == 0:
+            return 0.0
+        return self.decode_ms_total / self.decoded
+
+    @property
+    def latency_ms_mean(self) -> float:
+        if self.uploaded == 0:
+            return 0.0
+        return self.latency_ms_total / self.uploaded
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+image_loader = ImageLoader()
@@ -6,12 +6,25 @@ import bge.logic
 import imgui
 import ctypes
 from OpenGL import GL as gl
+from OpenGL.error import Error as GLError
 import bgl
 import pathlib
 from PIL import Image
 import glob
 import os
 
+from .atlas import AtlasRegion, ui_atlas
+from .batch import DrawStats, coalesce_commands
+from .glstate import GLStateCache
+from .loader import image_loader
+from .stream import ImguiStreamPass, RetainedOutput
+
+PIPELINE_AUTO = "auto"
+PIPELINE_STREAM = "stream"
+PIPELINE_FIXED = "fixed"
+
+INDEX_TYPE = gl.GL_UNSIGNED_SHORT if imgui.INDEX_SIZE == 2 else gl.GL_UNSIGNED_INT
+
 
 class BGEPipelineRenderer(BaseOpenGLRenderer):
     """Basic OpenGL integration base class."""
@@ -62,6 +75,8 @@ class BGEPipelineRenderer(BaseOpenGLRenderer):
         self._elements_handle = None
         self._vao_handle = None
         self.data = None
+        self.glState = GLStateCache()
+        self.drawStats = DrawStats()
 
         super(BGEPipelineRenderer, self).__init__()
         self.scene.post_draw.append(self.renderCall)
@@ -174,26 +189,10 @@ class BGEPipelineRenderer(BaseOpenGLRenderer):
 
         draw_data.scale_clip_rects(*io.display_fb_scale)
 
-        # backup GL state
-        common_gl_state_tuple = get_common_gl_state()
-
-        last_program = gl.glGetIntegerv(gl.GL_CURRENT_PROGRAM)
-        last_active_texture = gl.glGetIntegerv(gl.GL_ACTIVE_TEXTURE)
-        last_array_buffer = gl.glGetIntegerv(gl.GL_ARRAY_BUFFER_BINDING)
-        last_element_array_buffer = gl.glGetIntegerv(
-            gl.GL_ELEMENT_ARRAY_BUFFER_BINDING)
-        last_vertex_array = gl.glGetIntegerv(gl.GL_VERTEX_ARRAY_BINDING)
-
-        gl.glEnable(gl.GL_BLEND)
-        gl.glBlendEquation(gl.GL_FUNC_ADD)
-        gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
-        gl.glDisable(gl.GL_CULL_FACE)
-        gl.glDisable(gl.GL_DEPTH_TEST)
-        gl.glEnable(gl.GL_SCISSOR_TEST)
-        gl.glActiveTexture(gl.GL_TEXTURE0)
-        gl.glPolygonMode(gl.GL_FRONT_AND_BACK, gl.GL_FILL)
-
-        gl.glViewport(0, 0, int(fb_width), int(fb_height))
+        # only what's changed below is put back afterwards, see GLStateCache
+        state = self.glState
+        state.begin()
+        setupUIState(state, fb_width, fb_height)
 
         ortho_projection = (ctypes.c_float * 16)(
             2.0/display_width, 0.0,                   0.0, 0.0,
@@ -202,52 +201,38 @@ class BGEPipelineRenderer(BaseOpenGLRenderer):
             -1.0,               1.0,                   0.0, 1.0
         )
 
-        gl.glUseProgram(self._shader_handle)
+        state.use_program(self._shader_handle)
         gl.glUniform1i(self._attrib_location_tex, 0)
         gl.glUniformMatrix4fv(self._attrib_proj_mtx, 1,
                               gl.GL_FALSE, ortho_projection)
-        gl.glBindVertexArray(self._vao_handle)
+        state.bind_vertex_array(self._vao_handle)
 
-        for commands in draw_data.commands_lists:
-            idx_buffer_offset = 0
+        # The element buffer binding belongs to the VAO, it's restored along with it
+        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, self._elements_handle)
 
-            gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self._vbo_handle)
+        gltype = INDEX_TYPE
+        stats = self.drawStats
+        stats.begin_frame()
+        for commands in draw_data.commands_lists:
+            state.bind_array_buffer(self._vbo_handle)
             # todo: check this (sizes)
             gl.glBufferData(gl.GL_ARRAY_BUFFER, commands.vtx_buffer_size * imgui.VERTEX_SIZE,
                             ctypes.c_void_p(commands.vtx_buffer_data), gl.GL_STREAM_DRAW)
 
-            gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, self._elements_handle)
             # todo: check this (sizes)
             gl.glBufferData(gl.GL_ELEMENT_ARRAY_BUFFER, commands.idx_buffer_size *
                             imgui.INDEX_SIZE, ctypes.c_void_p(commands.idx_buffer_data), gl.GL_STREAM_DRAW)
 
-            # todo: allow to iterate over _CmdList
-            for command in commands.commands:
-                gl.glBindTexture(gl.GL_TEXTURE_2D, command.texture_id)
-
-                # todo: use named tuple
-                x, y, z, w = command.clip_rect
-                gl.glScissor(int(x), int(fb_height - w),
-                             int(z - x), int(w - y))
+            for texture_id, scissor, elem_count, offset in coalesce_commands(
+                    commands.commands, fb_height, 0, stats):
+                state.bind_texture(texture_id)
+                state.scissor(*scissor)
 
-                if imgui.INDEX_SIZE == 2:
-                    gltype = gl.GL_UNSIGNED_SHORT
-                else:
-                    gltype = gl.GL_UNSIGNED_INT
-
-                gl.glDrawElements(gl.GL_TRIANGLES, command.elem_count,
-                                  gltype, ctypes.c_void_p(idx_buffer_offset))
-
-                idx_buffer_offset += command.elem_count * imgui.INDEX_SIZE
+                gl.glDrawElements(gl.GL_TRIANGLES, elem_count,
+                                  gltype, ctypes.c_void_p(offset))
 
         # restore modified GL state
-        restore_common_gl_state(common_gl_state_tuple)
-
-        gl.glUseProgram(last_program)
-        gl.glActiveTexture(last_active_texture)
-        gl.glBindVertexArray(last_vertex_array)
-        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, last_array_buffer)
-        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, last_element_array_buffer)
+        state.end()
 
     def _invalidate_device_objects(self):
         if self._vao_handle > -1:
@@ -267,10 +252,86 @@ class BGEPipelineRenderer(BaseOpenGLRenderer):
         self._font_texture = 0
 
 
+class BGEStreamPipelineRenderer(BGEPipelineRenderer):
+    """ GL 3.3 renderer: one VAO, ring-buffered stream buffers and a single upload of every
+    command list per frame, see ImguiStreamPass. """
+
+    def __init__(self, scene: KX_Scene):
+        self.streamPass: ImguiStreamPass | None = None
+        self.retained: RetainedOutput | None = None
+        super().__init__(scene)
+        print("Using Stream Pipeline Renderer")
+
+    def setRetainedOutput(self, enabled: bool):
+        """ Composite the previous frame's texture while the UI doesn't change, see RetainedOutput. """
+        if enabled and self.retained is None:
+            self.retained = RetainedOutput()
+        elif not enabled and self.retained is not None:
+            self.retained.destroy()
+            self.retained = None
+
+    def _create_device_objects(self):
+        self.streamPass = ImguiStreamPass(
+            self.VERTEX_SHADER_SRC, self.FRAGMENT_SHADER_SRC, self.glState, self.drawStats)
+        try:
+            self.streamPass.create()
+        except (RuntimeError, GLError):
+            self.streamPass.destroy()
+            raise
+
+    def renderCall(self):
+        if self.data is None:
+            return
+        draw_data = self.data
+
+        # perf: local for faster access
+        io = self.io
+
+        display_width, display_height = io.display_size
+        fb_width = int(display_width * io.display_fb_scale[0])
+        fb_height = int(display_height * io.display_fb_scale[1])
+
+        if fb_width == 0 or fb_height == 0:
+            return
+
+        draw_data.scale_clip_rects(*io.display_fb_scale)
+
+        state = self.glState
+        state.begin()
+        setupUIState(state, fb_width, fb_height)
+
+        if self.retained is not None:
+            self.retained.draw(self.streamPass, draw_data, display_width, display_height,
+                               fb_width, fb_height)
+        else:
+            self.streamPass.draw(draw_data, display_width, display_height, fb_height)
+
+        # restore modified GL state, the element buffer binding goes back with the VAO
+        state.end()
+
+    def _invalidate_device_objects(self):
+        if self.streamPass is not None:
+            self.streamPass.destroy()
+        if self.retained is not None:
+            self.retained.destroy()
+
+        if self._font_texture > -1:
+            gl.glDeleteTextures([self._font_texture])
+        self.io.fonts.texture_id = 0
+        self._font_texture = 0
+
+
 class BGEFixedPipelineRenderer(BaseOpenGLRenderer):
     """Basic OpenGL integration base class."""
+    retained = None
+
+    def setRetainedOutput(self, enabled: bool):
+        # Needs framebuffers and the stream pipeline's shader, draws every frame here
+        pass
 
     def __init__(self, scene: KX_Scene):
+        self.glState = GLStateCache()
+        self.drawStats = DrawStats()
         super().__init__()
         self.scene = scene
         self.data = None
@@ -297,6 +358,8 @@ class BGEFixedPipelineRenderer(BaseOpenGLRenderer):
         self.io.fonts.texture_id = self._font_texture
         # gl.glBindTexture(gl.GL_TEXTURE_2D, last_texture)
         self.io.fonts.clear_tex_data()
+        # The binding is left changed outside a pass, the cached host texture is stale now
+        self.glState.invalidate()
 
     def _create_device_objects(self):
         pass
@@ -323,24 +386,18 @@ class BGEFixedPipelineRenderer(BaseOpenGLRenderer):
 
         # note: we are using fixed pipeline for cocos2d/pyglet
         # todo: consider porting to programmable pipeline
-        # backup gl state
-        common_gl_state_tuple = get_common_gl_state()
-
-        gl.glPushAttrib(gl.GL_ENABLE_BIT |
-                        gl.GL_COLOR_BUFFER_BIT | gl.GL_TRANSFORM_BIT)
-        gl.glEnable(gl.GL_BLEND)
-        gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
-        gl.glDisable(gl.GL_CULL_FACE)
-        gl.glDisable(gl.GL_DEPTH_TEST)
-        gl.glEnable(gl.GL_SCISSOR_TEST)
-        gl.glPolygonMode(gl.GL_FRONT_AND_BACK, gl.GL_FILL)
+        # enables, blend, scissor, viewport and the texture binding are restored by the
+        # state cache, the attribute stack only has to keep the matrix mode
+        state = self.glState
+        state.begin()
+        gl.glPushAttrib(gl.GL_TRANSFORM_BIT)
+        setupUIState(state, fb_width, fb_height, blendEquation=False, activeTexture=False)
 
         gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
         gl.glEnableClientState(gl.GL_TEXTURE_COORD_ARRAY)
         gl.glEnableClientState(gl.GL_COLOR_ARRAY)
-        gl.glEnable(gl.GL_TEXTURE_2D)
+        state.enable(gl.GL_TEXTURE_2D)
 
-        gl.glViewport(0, 0, int(fb_width), int(fb_height))
         gl.glMatrixMode(gl.GL_PROJECTION)
         gl.glPushMatrix()
         gl.glLoadIdentity()
@@ -349,9 +406,10 @@ class BGEFixedPipelineRenderer(BaseOpenGLRenderer):
         gl.glPushMatrix()
         gl.glLoadIdentity()
 
+        gltype = INDEX_TYPE
+        stats = self.drawStats
+        stats.begin_frame()
         for commands in draw_data.commands_lists:
-            idx_buffer = commands.idx_buffer_data
-
             gl.glVertexPointer(2, gl.GL_FLOAT, imgui.VERTEX_SIZE, ctypes.c_void_p(
                 commands.vtx_buffer_data + imgui.VERTEX_BUFFER_POS_OFFSET))
             gl.glTexCoordPointer(2, gl.GL_FLOAT, imgui.VERTEX_SIZE, ctypes.c_void_p(
@@ -359,24 +417,16 @@ class BGEFixedPipelineRenderer(BaseOpenGLRenderer):
             gl.glColorPointer(4, gl.GL_UNSIGNED_BYTE, imgui.VERTEX_SIZE, ctypes.c_void_p(
                 commands.vtx_buffer_data + imgui.VERTEX_BUFFER_COL_OFFSET))
 
-            for command in commands.commands:
-                gl.glBindTexture(gl.GL_TEXTURE_2D, command.texture_id)
-
-                x, y, z, w = command.clip_rect
-                gl.glScissor(int(x), int(fb_height - w),
-                             int(z - x), int(w - y))
-
-                if imgui.INDEX_SIZE == 2:
-                    gltype = gl.GL_UNSIGNED_SHORT
-                else:
-                    gltype = gl.GL_UNSIGNED_INT
+            # client-side indices, the offsets are pointers into imgui's index buffer
+            for texture_id, scissor, elem_count, idx_buffer in coalesce_commands(
+                    commands.commands, fb_height, commands.idx_buffer_data, stats):
+                state.bind_texture(texture_id)
+                state.scissor(*scissor)
 
-                gl.glDrawElements(gl.GL_TRIANGLES, command.elem_count,
+                gl.glDrawElements(gl.GL_TRIANGLES, elem_count,
                                   gltype, ctypes.c_void_p(idx_buffer))
 
-                idx_buffer += (command.elem_count * imgui.INDEX_SIZE)
-
-        restore_common_gl_state(common_gl_state_tuple)
+        state.end()
 
         gl.glDisableClientState(gl.GL_COLOR_ARRAY)
         gl.glDisableClientState(gl.GL_TEXTURE_COORD_ARRAY)
@@ -420,7 +470,10 @@ BGE_KEY_EVENT_MAP = {
 }
 
 
-class BGEImguiRenderer(BGEFixedPipelineRenderer):
+class BGEImguiIO:
+    """ BGE input, screen size, fonts and cursor handling shared by the imgui renderers.
+    Mixed in ahead of a pipeline renderer, see createImguiRenderer(). """
+
     def __init__(self, scene, cursorPath=None):
         self.scene = scene
         super().__init__(scene)
@@ -435,6 +488,7 @@ class BGEImguiRenderer(BGEFixedPipelineRenderer):
         self.show_cursor = True
         self.accept_input = True
         self.font_scaling_factor = 1
+        self.lastInputState = None
 
         # Check for RanGE so deltaTime can be updated
         if hasattr(bge.logic, "deltaTime"):
@@ -450,6 +504,11 @@ class BGEImguiRenderer(BGEFixedPipelineRenderer):
     def setCursorVisible(self, show: bool):
         self.show_cursor = show
 
+    def invalidateOutput(self):
+        """ Force the next frame to be drawn even if it fingerprints the same as the retained one. """
+        if self.retained is not None:
+            self.retained.invalidate()
+
     def _map_keys(self):
         key_map = self.io.key_map
         for bgeKey, imguiKey in BGE_KEY_EVENT_MAP.items():
@@ -458,7 +517,7 @@ class BGEImguiRenderer(BGEFixedPipelineRenderer):
     def updateScreenSize(self):
         width = bge.render.getWindowWidth()
         height = bge.render.getWindowHeight()
-        refreshSize = True
+        refreshSize = False
 
         if self.savedDisplaySize[0] != width:
             refreshSize = True
@@ -468,6 +527,9 @@ class BGEImguiRenderer(BGEFixedPipelineRenderer):
         if refreshSize:
             self.savedDisplaySize = width, height
             self.io.display_size = self.savedDisplaySize[0], self.savedDisplaySize[1]
+            # The engine's own viewport/scissor changed with the window
+            self.glState.invalidate()
+            self.invalidateOutput()
 
     def updateIO(self):
         io = imgui.get_io()
@@ -479,6 +541,14 @@ class BGEImguiRenderer(BGEFixedPipelineRenderer):
             self.updateMouse(io)
             self.updateKeyboard(io)
 
+            # Clicks, keys and typing can change the UI a frame or more after they happen.
+            # Plain mouse motion doesn't need this, hover and the cursor show up in the draw data.
+            inputState = (tuple(self.mouse.activeInputs), tuple(self.keyboard.activeInputs),
+                          self.keyboard.text)
+            if inputState != self.lastInputState:
+                self.lastInputState = inputState
+                self.invalidateOutput()
+
     def updateMousePos(self, io):
         mouse = self.mouse
         pos = ((mouse.position[0] * self.io.display_size[0]),
@@ -520,17 +590,13 @@ class BGEImguiRenderer(BGEFixedPipelineRenderer):
 
     def updateKeyboard(self, io):
         keyboard = self.keyboard
-        keyMap = BGE_KEY_EVENT_MAP
-
-        for key, event in keyboard.inputs.items():
-            if key in keyMap:
-                if event.active:
-                    io.keys_down[key] = True
-                else:
-                    io.keys_down[key] = False
-
         activeKeys = keyboard.activeInputs
 
+        # Only the mapped keys matter to imgui, no need to walk every keyboard input
+        keysDown = io.keys_down
+        for key in BGE_KEY_EVENT_MAP:
+            keysDown[key] = key in activeKeys
+
         io.key_ctrl = (bge.events.LEFTCTRLKEY in activeKeys) or (
             bge.events.RIGHTCTRLKEY in activeKeys)
         io.key_alt = (bge.events.LEFTALTKEY in activeKeys) or (
@@ -575,6 +641,31 @@ class BGEImguiRenderer(BGEFixedPipelineRenderer):
         if self.show_cursor:
             self.cursorRenderer.drawCursor()
 
+    def renderCall(self):
+        super().renderCall()
+        # The frame is drawn, images that turned up while it was built can be uploaded
+        image_loader.flush()
+
+
+class BGEImguiRenderer(BGEImguiIO, BGEFixedPipelineRenderer):
+    pass
+
+
+class BGEImguiStreamRenderer(BGEImguiIO, BGEStreamPipelineRenderer):
+    pass
+
+
+def createImguiRenderer(scene: KX_Scene, cursorPath=None, pipeline: str = PIPELINE_AUTO):
+    """ Renderer for pipeline ("auto", "stream" or "fixed"). The stream pipeline needs GL 3.3,
+    when the context doesn't have it this falls back to the fixed pipeline. """
+    if pipeline in (PIPELINE_AUTO, PIPELINE_STREAM):
+        try:
+            return BGEImguiStreamRenderer(scene, cursorPath=cursorPath)
+        except (RuntimeError, GLError) as error:
+            print(f"Stream pipeline unavailable ({error}), falling back")
+
+    return BGEImguiRenderer(scene, cursorPath=cursorPath)
+
 
 def get_rgba_pixels(image: Image.Image):
     if image.mode == "RGB":
@@ -592,7 +683,7 @@ class CursorRenderer:
         self.height = 0
         self.cursorWidth = 25
         self.cursorHeight = 25
-        self.cursorDict = {}
+        self.cursorDict: dict[str, AtlasRegion] = {}
 
     def setCursorSize(self, width: int, height: int):
         self.cursorWidth = width
@@ -608,6 +699,8 @@ class CursorRenderer:
 
         cursorList = glob.glob(filePath + '/**/*.png', recursive=True)
 
+        for region in self.cursorDict.values():
+            ui_atlas.release(region)
         self.cursorDict = {}
 
         for cursorFile in cursorList:
@@ -615,25 +708,13 @@ class CursorRenderer:
             image = Image.open(path)
             width, height = image.size
             cursorPixels = get_rgba_pixels(image)
+            image.close()
 
             fileName = os.path.basename(path)
             fileWithoutExtension = os.path.splitext(fileName)[0]
 
-            texID = gl.glGenTextures(1)
-
-            gl.glBindTexture(gl.GL_TEXTURE_2D, texID)
-            gl.glTexParameteri(
-                gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
-            gl.glTexParameteri(
-                gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
-            gl.glTexParameteri(
-                gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP_TO_BORDER)
-            gl.glTexParameteri(
-                gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, gl.GL_CLAMP_TO_BORDER)
-            gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA, width,
-                            height, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, cursorPixels)
-
-            self.cursorDict[fileWithoutExtension] = texID
+            # Cursors share an atlas page with each other and the UI's images
+            self.cursorDict[fileWithoutExtension] = ui_atlas.add(cursorPixels, width, height)
 
     def drawCursor(self):
         width = self.cursorWidth
@@ -648,98 +729,26 @@ class CursorRenderer:
 
         match imgui.get_mouse_cursor():
             case imgui.MOUSE_CURSOR_ARROW:
-                textureID = self.cursorDict["arrow"]
+                region = self.cursorDict["arrow"]
             case imgui.MOUSE_CURSOR_RESIZE_NWSE:
-                textureID = self.cursorDict["resize"]
+                region = self.cursorDict["resize"]
             case _:
-                textureID = self.cursorDict["arrow"]
-
-        draw_list.add_image(textureID, pos, pos2)
-
-
-def get_common_gl_state():
-    """
-    Backups the current OpenGL state
-    Returns a tuple of results for glGet / glIsEnabled calls
-    NOTE: when adding more backuped state in the future,
-    make sure to update function `restore_common_gl_state`
-    """
-    last_texture = gl.glGetIntegerv(gl.GL_TEXTURE_BINDING_2D)
-    last_viewport = gl.glGetIntegerv(gl.GL_VIEWPORT)
-    last_enable_blend = gl.glIsEnabled(gl.GL_BLEND)
-    last_enable_cull_face = gl.glIsEnabled(gl.GL_CULL_FACE)
-    last_enable_depth_test = gl.glIsEnabled(gl.GL_DEPTH_TEST)
-    last_enable_scissor_test = gl.glIsEnabled(gl.GL_SCISSOR_TEST)
-    last_scissor_box = gl.glGetIntegerv(gl.GL_SCISSOR_BOX)
-    last_blend_src = gl.glGetIntegerv(gl.GL_BLEND_SRC)
-    last_blend_dst = gl.glGetIntegerv(gl.GL_BLEND_DST)
-    last_blend_equation_rgb = gl. glGetIntegerv(gl.GL_BLEND_EQUATION_RGB)
-    last_blend_equation_alpha = gl.glGetIntegerv(gl.GL_BLEND_EQUATION_ALPHA)
-    last_front_and_back_polygon_mode, _ = gl.glGetIntegerv(gl.GL_POLYGON_MODE)
-    return (
-        last_texture,
-        last_viewport,
-        last_enable_blend,
-        last_enable_cull_face,
-        last_enable_depth_test,
-        last_enable_scissor_test,
-        last_scissor_box,
-        last_blend_src,
-        last_blend_dst,
-        last_blend_equation_rgb,
-        last_blend_equation_alpha,
-        last_front_and_back_polygon_mode,
-    )
-
-
-def restore_common_gl_state(common_gl_state_tuple):
-    """
-    Takes a tuple after calling function `get_common_gl_state`,
-    to set the given OpenGL state back as it was before rendering the UI
-    """
-    (
-        last_texture,
-        last_viewport,
-        last_enable_blend,
-        last_enable_cull_face,
-        last_enable_depth_test,
-        last_enable_scissor_test,
-        last_scissor_box,
-        last_blend_src,
-        last_blend_dst,
-        last_blend_equation_rgb,
-        last_blend_equation_alpha,
-        last_front_and_back_polygon_mode,
-    ) = common_gl_state_tuple
-
-    gl.glBindTexture(gl.GL_TEXTURE_2D, last_texture)
-    gl.glBlendEquationSeparate(
-        last_blend_equation_rgb, last_blend_equation_alpha)
-    gl.glBlendFunc(last_blend_src, last_blend_dst)
-
-    gl.glPolygonMode(gl.GL_FRONT_AND_BACK, last_front_and_back_polygon_mode)
-
-    if last_enable_blend:
-        gl.glEnable(gl.GL_BLEND)
-    else:
-        gl.glDisable(gl.GL_BLEND)
-
-    if last_enable_cull_face:
-        gl.glEnable(gl.GL_CULL_FACE)
-    else:
-        gl.glDisable(gl.GL_CULL_FACE)
-
-    if last_enable_depth_test:
-        gl.glEnable(gl.GL_DEPTH_TEST)
-    else:
-        gl.glDisable(gl.GL_DEPTH_TEST)
-
-    if last_enable_scissor_test:
-        gl.glEnable(gl.GL_SCISSOR_TEST)
-    else:
-        gl.glDisable(gl.GL_SCISSOR_TEST)
-
-    gl.glScissor(last_scissor_box[0], last_scissor_box[1],
-                 last_scissor_box[2], last_scissor_box[3])
-    gl.glViewport(last_viewport[0], last_viewport[1],
-                  last_viewport[2], last_viewport[3])
+                region = self.cursorDict["arrow"]
+
+        draw_list.add_image(region.texture_id, pos, pos2, region.uv0, region.uv1)
+
+
+def setupUIState(state: GLStateCache, fb_width: int, fb_height: int,
+                 blendEquation: bool = True, activeTexture: bool = True):
+    """ State every imgui pass draws with, set through the cache so unchanged pieces cost nothing. """
+    state.enable(gl.GL_BLEND)
+    if blendEquation:
+        state.blend_equation(gl.GL_FUNC_ADD)
+    state.blend_func(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+    state.disable(gl.GL_CULL_FACE)
+    state.disable(gl.GL_DEPTH_TEST)
+    state.enable(gl.GL_SCISSOR_TEST)
+    if activeTexture:
+        state.active_texture(gl.GL_TEXTURE0)
+    state.polygon_mode(gl.GL_FILL)
+    state.viewport(0, 0, int(fb_width), int(fb_height))
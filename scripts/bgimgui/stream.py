@@ -0,0 +1,417 @@
+import ctypes
+import hashlib
+import re
+import struct
+
+import imgui
+from OpenGL import GL as gl
+
+from .batch import DrawStats, coalesce_commands
+from .glstate import GLStateCache
+
+# Nothing in here touches bge, so the pass can be driven from a plain (e.g. Mesa) GL context
+
+# Frames of vertex/index data kept in flight before a segment is written again
+RING_SEGMENTS = 3
+INITIAL_VERTEX_CAPACITY = 1 << 14
+INITIAL_INDEX_CAPACITY = 1 << 15
+
+MIN_GL_VERSION = (3, 3)
+
+
+def gl_version() -> tuple[int, int]:
+    """ (major, minor) of the current context, (0, 0) when it can't be read. """
+    version = gl.glGetString(gl.GL_VERSION)
+    if not version:
+        return 0, 0
+    if isinstance(version, bytes):
+        version = version.decode(errors="ignore")
+
+    match = re.search(r"(\d+)\.(\d+)", version)
+    if match is None:
+        return 0, 0
+    return int(match.group(1)), int(match.group(2))
+
+
+def supports_stream_pipeline() -> bool:
+    return gl_version() >= MIN_GL_VERSION
+
+
+def _next_capacity(capacity: int, needed: int) -> int:
+    while capacity < needed:
+        capacity *= 2
+    return capacity
+
+
+def _compile_shader(shader_type, source: str):
+    shader = gl.glCreateShader(shader_type)
+    gl.glShaderSource(shader, source)
+    gl.glCompileShader(shader)
+
+    if not gl.glGetShaderiv(shader, gl.GL_COMPILE_STATUS):
+        log = gl.glGetShaderInfoLog(shader)
+        gl.glDeleteShader(shader)
+        raise RuntimeError(f"imgui shader failed to compile: {log}")
+    return shader
+
+
+class ImguiStreamPass:
+    """ Draws imgui draw data through one VAO and a vertex/index buffer pair split into
+    RING_SEGMENTS segments. Each frame every command list is packed on the CPU and uploaded
+    with a single glBufferSubData per buffer into the next segment, and the buffers are
+    orphaned whenever the ring wraps so the driver never waits on a draw still in flight. """
+
+    def __init__(self, vertex_src: str, fragment_src: str, state: GLStateCache | None = None,
+                 stats: DrawStats | None = None) -> None:
+        self.vertex_src = vertex_src
+        self.fragment_src = fragment_src
+        self.state = state if state is not None else GLStateCache()
+        self.stats = stats if stats is not None else DrawStats()
+
+        self.program = 0
+        self.vao = 0
+        self.vbo = 0
+        self.ebo = 0
+
+        self.location_tex = -1
+        self.location_proj_mtx = -1
+
+        self.vertex_capacity = 0
+        self.index_capacity = 0
+        self.segment = 0
+        self.vertex_staging = None
+        self.index_staging = None
+
+        if imgui.INDEX_SIZE == 2:
+            self.index_type = gl.GL_UNSIGNED_SHORT
+        else:
+            self.index_type = gl.GL_UNSIGNED_INT
+
+        # Per frame: (command list, base vertex, index byte offset) of the last upload
+        self.uploaded: list[tuple] = []
+        self.bytes_uploaded = 0
+
+    def create(self):
+        """ Build the program and buffers, raises RuntimeError if the context can't. """
+        if not supports_stream_pipeline():
+            raise RuntimeError(f"GL {gl_version()} is older than {MIN_GL_VERSION}")
+
+        vertex_shader = _compile_shader(gl.GL_VERTEX_SHADER, self.vertex_src)
+        fragment_shader = _compile_shader(gl.GL_FRAGMENT_SHADER, self.fragment_src)
+
+        program = gl.glCreateProgram()
+        gl.glAttachShader(program, vertex_shader)
+        gl.glAttachShader(program, fragment_shader)
+        gl.glLinkProgram(program)
+        gl.glDeleteShader(vertex_shader)
+        gl.glDeleteShader(fragment_shader)
+
+        if not gl.glGetProgramiv(program, gl.GL_LINK_STATUS):
+            log = gl.glGetProgramInfoLog(program)
+            gl.glDeleteProgram(program)
+            raise RuntimeError(f"imgui shader failed to link: {log}")
+        self.program = program
+
+        self.location_tex = gl.glGetUniformLocation(program, "Texture")
+        self.location_proj_mtx = gl.glGetUniformLocation(program, "ProjMtx")
+        location_position = gl.glGetAttribLocation(program, "Position")
+        location_uv = gl.glGetAttribLocation(program, "UV")
+        location_color = gl.glGetAttribLocation(program, "Color")
+
+        last_array_buffer = gl.glGetIntegerv(gl.GL_ARRAY_BUFFER_BINDING)
+        last_vertex_array = gl.glGetIntegerv(gl.GL_VERTEX_ARRAY_BINDING)
+
+        self.vbo = gl.glGenBuffers(1)
+        self.ebo = gl.glGenBuffers(1)
+        self.vao = gl.glGenVertexArrays(1)
+
+        # The element buffer binding and the attribute layout live in the VAO, set them once
+        gl.glBindVertexArray(self.vao)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.vbo)
+        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+        self._allocate(INITIAL_VERTEX_CAPACITY, INITIAL_INDEX_CAPACITY)
+
+        gl.glEnableVertexAttribArray(location_position)
+        gl.glEnableVertexAttribArray(location_uv)
+        gl.glEnableVertexAttribArray(location_color)
+
+        gl.glVertexAttribPointer(location_position, 2, gl.GL_FLOAT, gl.GL_FALSE,
+                                 imgui.VERTEX_SIZE, ctypes.c_void_p(imgui.VERTEX_BUFFER_POS_OFFSET))
+        gl.glVertexAttribPointer(location_uv, 2, gl.GL_FLOAT, gl.GL_FALSE,
+                                 imgui.VERTEX_SIZE, ctypes.c_void_p(imgui.VERTEX_BUFFER_UV_OFFSET))
+        gl.glVertexAttribPointer(location_color, 4, gl.GL_UNSIGNED_BYTE, gl.GL_TRUE,
+                                 imgui.VERTEX_SIZE, ctypes.c_void_p(imgui.VERTEX_BUFFER_COL_OFFSET))
+
+        gl.glBindVertexArray(last_vertex_array)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, last_array_buffer)
+
+    def _allocate(self, vertex_capacity: int, index_capacity: int):
+        # Caller has the VAO (and so the element buffer) and the vertex buffer bound
+        self.vertex_capacity = vertex_capacity
+        self.index_capacity = index_capacity
+        self.segment = 0
+
+        vertex_bytes = vertex_capacity * imgui.VERTEX_SIZE
+        index_bytes = index_capacity * imgui.INDEX_SIZE
+
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, vertex_bytes * RING_SEGMENTS,
+                        None, gl.GL_STREAM_DRAW)
+        gl.glBufferData(gl.GL_ELEMENT_ARRAY_BUFFER, index_bytes * RING_SEGMENTS,
+                        None, gl.GL_STREAM_DRAW)
+
+        self.vertex_staging = (ctypes.c_ubyte * vertex_bytes)()
+        self.index_staging = (ctypes.c_ubyte * index_bytes)()
+
+    def _orphan(self):
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, self.vertex_capacity * imgui.VERTEX_SIZE * RING_SEGMENTS,
+                        None, gl.GL_STREAM_DRAW)
+        gl.glBufferData(gl.GL_ELEMENT_ARRAY_BUFFER, self.index_capacity * imgui.INDEX_SIZE * RING_SEGMENTS,
+                        None, gl.GL_STREAM_DRAW)
+
+    def upload(self, draw_data):
+        """ Pack every command list of draw_data into the next ring segment.
+        The VAO and vertex buffer must be bound. """
+        commands_lists = draw_data.commands_lists
+        vertex_count = 0
+        index_count = 0
+        for commands in commands_lists:
+            vertex_count += commands.vtx_buffer_size
+            index_count += commands.idx_buffer_size
+
+        if vertex_count > self.vertex_capacity or index_count > self.index_capacity:
+            # Reallocating orphans the old storage too
+            self._allocate(_next_capacity(self.vertex_capacity, vertex_count),
+                           _next_capacity(self.index_capacity, index_count))
+        else:
+            self.segment = (self.segment + 1) % RING_SEGMENTS
+            if self.segment == 0:
+                self._orphan()
+
+        vertex_staging = ctypes.addressof(self.vertex_staging)
+        index_staging = ctypes.addressof(self.index_staging)
+        base_vertex = self.segment * self.vertex_capacity
+        index_offset = self.segment * self.index_capacity * imgui.INDEX_SIZE
+
+        uploaded = []
+        vertex_bytes = 0
+        index_bytes = 0
+        for commands in commands_lists:
+            size = commands.vtx_buffer_size * imgui.VERTEX_SIZE
+            ctypes.memmove(vertex_staging + vertex_bytes, commands.vtx_buffer_data, size)
+
+            uploaded.append((commands, base_vertex + vertex_bytes // imgui.VERTEX_SIZE,
+                             index_offset + index_bytes))
+            vertex_bytes += size
+
+            size = commands.idx_buffer_size * imgui.INDEX_SIZE
+            ctypes.memmove(index_staging + index_bytes, commands.idx_buffer_data, size)
+            index_bytes += size
+
+        if vertex_bytes > 0:
+            gl.glBufferSubData(gl.GL_ARRAY_BUFFER, base_vertex * imgui.VERTEX_SIZE,
+                               vertex_bytes, self.vertex_staging)
+            gl.glBufferSubData(gl.GL_ELEMENT_ARRAY_BUFFER, index_offset,
+                               index_bytes, self.index_staging)
+
+        self.uploaded = uploaded
+        self.bytes_uploaded = vertex_bytes + index_bytes
+
+    def set_projection(self, display_width: float, display_height: float):
+        """ Load the UI's orthographic projection, the program must be in use. """
+        ortho_projection = (ctypes.c_float * 16)(
+            2.0/display_width, 0.0,                   0.0, 0.0,
+            0.0,               2.0/-display_height,   0.0, 0.0,
+            0.0,               0.0,                  -1.0, 0.0,
+            -1.0,               1.0,                   0.0, 1.0
+        )
+
+        gl.glUniform1i(self.location_tex, 0)
+        gl.glUniformMatrix4fv(self.location_proj_mtx, 1, gl.GL_FALSE, ortho_projection)
+
+    def draw(self, draw_data, display_width: float, display_height: float, fb_height: int):
+        """ Upload and draw draw_data. Blend/scissor/viewport state is left to the caller. """
+        state = self.state
+        state.use_program(self.program)
+        self.set_projection(display_width, display_height)
+        state.bind_vertex_array(self.vao)
+        state.bind_array_buffer(self.vbo)
+
+        self.upload(draw_data)
+
+        index_type = self.index_type
+        stats = self.stats
+        stats.begin_frame()
+        for commands, base_vertex, index_offset in self.uploaded:
+            for texture_id, scissor, elem_count, offset in coalesce_commands(
+                    commands.commands, fb_height, index_offset, stats):
+                state.bind_texture(texture_id)
+                state.scissor(*scissor)
+
+                gl.glDrawElementsBaseVertex(gl.GL_TRIANGLES, elem_count, index_type,
+                                            ctypes.c_void_p(offset), base_vertex)
+
+    def destroy(self):
+        if self.vao:
+            gl.glDeleteVertexArrays(1, [self.vao])
+        if self.vbo:
+            gl.glDeleteBuffers(1, [self.vbo])
+        if self.ebo:
+            gl.glDeleteBuffers(1, [self.ebo])
+        if self.program:
+            gl.glDeleteProgram(self.program)
+        self.vao = self.vbo = self.ebo = self.program = 0
+
+
+def fingerprint_draw_data(draw_data) -> bytes:
+    """ Digest of every command list's vertex and index bytes plus each command's texture,
+    clip rectangle and element count, equal digests draw the same pixels. """
+    digest = hashlib.blake2b(digest_size=16)
+    for commands in draw_data.commands_lists:
+        digest.update(ctypes.string_at(commands.vtx_buffer_data,
+                                       commands.vtx_buffer_size * imgui.VERTEX_SIZE))
+        digest.update(ctypes.string_at(commands.idx_buffer_data,
+                                       commands.idx_buffer_size * imgui.INDEX_SIZE))
+        for command in commands.commands:
+            digest.update(repr((command.texture_id, tuple(command.clip_rect),
+                                command.elem_count)).encode())
+    return digest.digest()
+
+
+class RetainedOutput:
+    """ Keeps the last UI frame in an offscreen texture. When a frame fingerprints the same
+    as the one in the texture and nothing invalidated it, the texture is composited with one
+    quad instead of uploading and drawing the command lists again. """
+
+    def __init__(self) -> None:
+        self.framebuffer = 0
+        self.texture = 0
+        self.size = (0, 0)
+
+        self.quad_vao = 0
+        self.quad_vbo = 0
+        self.quad_size = (0.0, 0.0)
+
+        self.fingerprint: bytes | None = None
+        self.dirty = True
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / total
+
+    def invalidate(self):
+        self.dirty = True
+
+    def _ensure_target(self, state: GLStateCache, fb_width: int, fb_height: int):
+        if self.size == (fb_width, fb_height):
+            return
+
+        if not self.texture:
+            self.texture = gl.glGenTextures(1)
+        state.bind_texture(self.texture)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_NEAREST)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_NEAREST)
+        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA8, fb_width, fb_height, 0,
+                        gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, None)
+
+        if not self.framebuffer:
+            self.framebuffer = gl.glGenFramebuffers(1)
+        state.bind_draw_framebuffer(self.framebuffer)
+        gl.glFramebufferTexture2D(gl.GL_DRAW_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0,
+                                  gl.GL_TEXTURE_2D, self.texture, 0)
+
+        self.size = (fb_width, fb_height)
+        self.dirty = True
+
+    def _ensure_quad(self, stream_pass: ImguiStreamPass, display_width: float, display_height: float):
+        state = stream_pass.state
+        if not self.quad_vao:
+            self.quad_vao = gl.glGenVertexArrays(1)
+            self.quad_vbo = gl.glGenBuffers(1)
+
+            state.bind_vertex_array(self.quad_vao)
+            state.bind_array_buffer(self.quad_vbo)
+            program = stream_pass.program
+            for name, count, gltype, normalized, offset in (
+                    ("Position", 2, gl.GL_FLOAT, gl.GL_FALSE, imgui.VERTEX_BUFFER_POS_OFFSET),
+                    ("UV", 2, gl.GL_FLOAT, gl.GL_FALSE, imgui.VERTEX_BUFFER_UV_OFFSET),
+                    ("Color", 4, gl.GL_UNSIGNED_BYTE, gl.GL_TRUE, imgui.VERTEX_BUFFER_COL_OFFSET)):
+                location = gl.glGetAttribLocation(program, name)
+                gl.glEnableVertexAttribArray(location)
+                gl.glVertexAttribPointer(location, count, gltype, normalized,
+                                         imgui.VERTEX_SIZE, ctypes.c_void_p(offset))
+
+        if self.quad_size == (display_width, display_height):
+            state.bind_vertex_array(self.quad_vao)
+            return
+
+        # Triangle strip over the display in imgui's vertex layout (pos, uv, rgba8). The texture's rows go
+        # bottom to top while the UI projection goes top to bottom, so V is flipped.
+        vertex = struct.Struct("<ffff4B")
+        data = b"".join(vertex.pack(x, y, u, v, 255, 255, 255, 255) for x, y, u, v in (
+            (0.0, 0.0, 0.0, 1.0),
+            (0.0, display_height, 0.0, 0.0),
+            (display_width, 0.0, 1.0, 1.0),
+            (display_width, display_height, 1.0, 0.0)))
+
+        state.bind_vertex_array(self.quad_vao)
+        state.bind_array_buffer(self.quad_vbo)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, len(data), data, gl.GL_STATIC_DRAW)
+        self.quad_size = (display_width, display_height)
+
+    def draw(self, stream_pass: ImguiStreamPass, draw_data, display_width: float,
+             display_height: float, fb_width: int, fb_height: int):
+        """ Same contract as ImguiStreamPass.draw(), blending must already be enabled. """
+        state = stream_pass.state
+        # The composite goes wherever BGE is drawing this frame, not where it drew the last one
+        host_framebuffer = state.refresh("draw_framebuffer")
+        self._ensure_target(state, fb_width, fb_height)
+
+        fingerprint = fingerprint_draw_data(draw_data)
+        if self.dirty or fingerprint != self.fingerprint:
+            self.misses += 1
+
+            state.bind_draw_framebuffer(self.framebuffer)
+            state.disable(gl.GL_SCISSOR_TEST)
+            state.clear_color(0.0, 0.0, 0.0, 0.0)
+            gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+            state.enable(gl.GL_SCISSOR_TEST)
+
+            # Premultiplied colour with correct coverage in alpha, composited with ONE below
+            state.blend_func_separate(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA,
+                                      gl.GL_ONE, gl.GL_ONE_MINUS_SRC_ALPHA)
+            stream_pass.draw(draw_data, display_width, display_height, fb_height)
+
+            self.fingerprint = fingerprint
+            self.dirty = False
+        else:
+            self.hits += 1
+            state.use_program(stream_pass.program)
+            stream_pass.set_projection(display_width, display_height)
+
+        state.bind_draw_framebuffer(host_framebuffer)
+        self._ensure_quad(stream_pass, display_width, display_height)
+        state.blend_func(gl.GL_ONE, gl.GL_ONE_MINUS_SRC_ALPHA)
+        state.scissor(0, 0, fb_width, fb_height)
+        state.bind_texture(self.texture)
+        gl.glDrawArrays(gl.GL_TRIANGLE_STRIP, 0, 4)
+
+    def destroy(self):
+        if self.quad_vao:
+            gl.glDeleteVertexArrays(1, [self.quad_vao])
+        if self.quad_vbo:
+            gl.glDeleteBuffers(1, [self.quad_vbo])
+        if self.framebuffer:
+            gl.glDeleteFramebuffers(1, [self.framebuffer])
+        if self.texture:
+            gl.glDeleteTextures([self.texture])
+        self.quad_vao = self.quad_vbo = self.framebuffer = self.texture = 0
+        self.size = (0, 0)
+        self.quad_size = (0.0, 0.0)
+        self.fingerprint = None
+        self.dirty = True
@@ -118,6 +118,10 @@ class GUIWindow:
         self.show = True
 
     def setVisible(self, visible: bool):
+        if visible != self.show:
+            gui = getattr(bge.logic, "gui", None)
+            if gui is not None:
+                gui.imgui_backend.invalidateOutput()
         self.show = visible
 
     def drawWindow(self):
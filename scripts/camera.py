@@ -1,37 +1,178 @@
+import math
+import time
+
 import bge
 from bge.types import SCA_PythonController, KX_GameObject
-from mathutils import Vector
+from mathutils import Matrix, Vector
+
+from .handles import getObject
 
-POS_LERP_FACTOR = 0.1
 ROT_SLERP_FACTOR = 0.1
 
+# The factors above were applied once per 60Hz tick, as decay rates per second they become:
+REFERENCE_TICK = 1.0 / 60.0
+ROT_DECAY_RATE = -math.log(1.0 - ROT_SLERP_FACTOR) / REFERENCE_TICK
+# The rig snaps to the ship's orientation once their quaternions' dot product is this close to 1
+ROT_SNAP_EPSILON = 1e-6
 
-def followShip(cont: SCA_PythonController):
-    if cont.sensors["loop"].positive:
-        own = cont.owner
-        ship: KX_GameObject = own.scene.objects["ship"]
+# Collision probe: skip casting while the ship and camera anchor stay within this distance
+COLLIDE_MOVE_THRESHOLD = 0.05
+# Probes per second at most, whatever the logic tick rate is
+COLLIDE_RATE = 10.0
+# Offset of the outer probe rays from the centre ray, gives the probe some thickness
+PROBE_RADIUS = 0.4
+# How fast (per second) the camera eases back out after an obstruction clears (it snaps inwards)
+COLLIDE_RELEASE_RATE = -math.log(1.0 - 0.2) / REFERENCE_TICK
 
-        shipPos = ship.worldPosition
 
-        own.worldPosition = shipPos.lerp(own.worldPosition, POS_LERP_FACTOR)
+def decayFactor(rate: float, dt: float) -> float:
+    """ Blend factor that closes the same share of a gap per second whatever dt is. """
+    return 1.0 - math.exp(-rate * dt)
 
-        curOrient = own.worldOrientation.to_quaternion()
-        shipOrient = ship.worldOrientation.to_quaternion()
 
-        own.worldOrientation = curOrient.slerp(shipOrient, ROT_SLERP_FACTOR)
+class CameraCollider:
+    """ Keeps the camera in front of walls between the ship and the camera anchor.
+    Casts a thick multi-ray probe only when things moved, at a reduced rate, and
+    smooths the result in between. """
 
+    def __init__(self) -> None:
+        self.lastShipPos: Vector | None = None
+        self.lastCamPos: Vector | None = None
+        self.timeSinceCast = 1.0 / COLLIDE_RATE
 
-def collide(cont: SCA_PythonController):
-    if cont.sensors["loop"].positive:
-        own = cont.owner
-        parent = own.parent
-        target = own.scene.objects["cameraTarget"]
-        ship: KX_GameObject = own.scene.objects["ship"]
-        camPos: KX_GameObject = own.scene.objects["cameraPosition"]
-
-        cast = ship.rayCast(camPos, dist=(camPos.getDistanceTo(target)))
-        if cast[0]:
-            hitPoint = cast[1]
-            parent.worldPosition = hitPoint
+        # Fraction of the ship -> anchor segment that's free, from the last probe
+        self.targetFraction = 1.0
+        self.fraction = 1.0
+
+        # Raycast accounting against the old one-ray-per-tick behaviour
+        self.ticks = 0
+        self.raysCast = 0
+        self.raysPerSecond = 0.0
+        # Rays the old collide() would have cast (one per tick), and the difference
+        self.oldRaysPerSecond = 0.0
+        self.savedPerSecond = 0.0
+        self.windowStart = time.perf_counter()
+
+    def _moved(self, shipPos: Vector, camPos: Vector) -> bool:
+        if self.lastShipPos is None:
+            return True
+        return ((shipPos - self.lastShipPos).length > COLLIDE_MOVE_THRESHOLD
+                or (camPos - self.lastCamPos).length > COLLIDE_MOVE_THRESHOLD)
+
+    def _probe(self, ship: KX_GameObject, shipPos: Vector, anchor: Vector,
+               orientation: Matrix, dist: float) -> float:
+        right = orientation.col[0].xyz * PROBE_RADIUS
+        up = orientation.col[2].xyz * PROBE_RADIUS
+
+        fraction = 1.0
+        for offset in (Vector((0.0, 0.0, 0.0)), right, -right, up, -up):
+            rayFrom = shipPos + offset
+            rayTo = anchor + offset
+            hitObj, hitPoint, _ = ship.rayCast(rayTo, rayFrom, dist)
+            self.raysCast += 1
+
+            if hitObj is not None:
+                length = (rayTo - rayFrom).length
+                if length > 0.0:
+                    fraction = min(fraction, (hitPoint - rayFrom).length / length)
+
+        return fraction
+
+    def _account(self):
+        self.ticks += 1
+        now = time.perf_counter()
+        elapsed = now - self.windowStart
+        if elapsed >= 1.0:
+            self.raysPerSecond = self.raysCast / elapsed
+            self.oldRaysPerSecond = self.ticks / elapsed
+            # Negative while the multi-ray probe casts more often than once per tick's worth
+            self.savedPerSecond = self.oldRaysPerSecond - self.raysPerSecond
+            self.ticks = 0
+            self.raysCast = 0
+            self.windowStart = now
+
+    def update(self, ship: KX_GameObject, shipPos: Vector, anchor: Vector,
+               orientation: Matrix, dist: float, dt: float) -> Vector:
+        """ Returns where the camera rig should be this tick, between shipPos and anchor. """
+        self.timeSinceCast += dt
+
+        if self.timeSinceCast >= 1.0 / COLLIDE_RATE and self._moved(shipPos, anchor):
+            self.targetFraction = self._probe(ship, shipPos, anchor, orientation, dist)
+            self.lastShipPos = shipPos.copy()
+            self.lastCamPos = anchor.copy()
+            self.timeSinceCast = 0.0
+
+        if self.targetFraction < self.fraction:
+            # Never ease into a wall
+            self.fraction = self.targetFraction
         else:
-            parent.worldPosition = camPos.worldPosition
+            self.fraction += (self.targetFraction - self.fraction) * \
+                decayFactor(COLLIDE_RELEASE_RATE, dt)
+
+        self._account()
+
+        return shipPos.lerp(anchor, self.fraction)
+
+
+def updateRig(rig: KX_GameObject):
+    """ Single camera pass: collision-corrected position and time-based orientation
+    smoothing, each written to the rig once per tick. """
+    scene = rig.scene
+    ship: KX_GameObject = getObject(scene, "ship")
+    target = getObject(scene, "cameraTarget")
+    camPos: KX_GameObject = getObject(scene, "cameraPosition")
+
+    if "collider" not in rig:
+        rig["collider"] = CameraCollider()
+        bge.logic.cameraCollider = rig["collider"]
+
+    collider: CameraCollider = rig["collider"]
+
+    dt = 1.0 / bge.logic.getLogicTicRate()
+
+    shipPos = ship.worldPosition
+    anchor = camPos.worldPosition
+    shipMatrix = ship.worldOrientation
+
+    pose = ship.get("flightPose")
+    if pose is not None:
+        # Follow the model's interpolated pose (ship.PoseInterpolator) rather than the physics
+        # body, the anchor rides on the body so it's carried over to the drawn pose
+        drawnPos, shipOrient = pose.drawn
+        shipMatrix = shipOrient.to_matrix()
+        anchor = drawnPos + shipMatrix @ (ship.worldOrientation.transposed() @ (anchor - shipPos))
+        shipPos = drawnPos
+    else:
+        shipOrient = shipMatrix.to_quaternion()
+
+    rig.worldPosition = collider.update(
+        ship, shipPos, anchor, camPos.worldOrientation, camPos.getDistanceTo(target), dt)
+
+    curOrient = rig.worldOrientation.to_quaternion()
+
+    # Caught up (or parked): take the ship's orientation as is instead of slerping the rest
+    if abs(curOrient.dot(shipOrient)) > 1.0 - ROT_SNAP_EPSILON:
+        rig.worldOrientation = shipMatrix
+    else:
+        rig.worldOrientation = curOrient.slerp(
+            shipOrient, decayFactor(ROT_DECAY_RATE, dt))
+
+
+def followShip(cont: SCA_PythonController):
+    if cont.sensors["loop"].positive:
+        rig = cont.owner
+        ship = getObject(rig.scene, "ship")
+
+        if "flightPose" in ship:
+            # ship.movement() runs the rig right after drawing the model, see updateRig()
+            ship["cameraRig"] = rig
+            return
+
+        updateRig(rig)
+
+
+def collide(cont: SCA_PythonController):
+    # The rig's position used to be overwritten here after followShip had lerped it,
+    # both now happen in one updateRig() pass. The ship's logic bricks in game.range still
+    # run this controller, so it stays until the blend drops it.
+    pass
@@ -1,7 +1,9 @@
 import bge
 from bge.types import SCA_PythonController
 from .gui import MainGameGUI
+from .inputs import getInputs
 from .levels import LevelManager
+from .replay import setupFromEnvironment
 
 
 def initGame(cont: SCA_PythonController):
@@ -28,6 +30,8 @@ def runGUI(cont: SCA_PythonController):
 def initLevelManager(cont: SCA_PythonController):
     if cont.sensors["tap"].positive:
         own = cont.owner
+        # Benchmark runs record or replay inputs from the first level on
+        setupFromEnvironment(getInputs())
         own["levelManager"] = LevelManager(own.scene)
 
 
@@ -1,6 +1,11 @@
 import os
 
+from .audio import getAudioManager
 from .bgimgui import BGEImguiWrapper, styleGUI
+from .bgimgui.atlas import ui_atlas
+from .bgimgui.glstate import DEBUG_VALIDATE_INTERVAL
+from .bgimgui.loader import image_loader
+from .handles import getScene
 from . import windows
 from .windows import GUIModes
 
@@ -17,9 +22,19 @@ DEFAULT_KEY_MAP = {
     "shoot": "LEFTMOUSE"
 }
 
+# Music for each GUI mode, None fades the music out
+TITLE_MUSIC = "Title.m4a"
+GAME_MUSIC = None
+
 DEFAULT_CONFIG = {
     "DIRECTION": False,
-    "MOUSE_SENSITIVITY": 1.0
+    "MOUSE_SENSITIVITY": 1.0,
+    "VECTOR_PROJECTILES": False,
+    "PROFILE_LOADS": False,
+    "UI_RENDERER": "auto",
+    "UI_RETAINED": False,
+    "UI_ATLAS": True,
+    "UI_IMAGE_UPLOAD_MS": 2.0
 }
 
 
@@ -89,7 +104,14 @@ class MainGameGUI(BGEImguiWrapper):
 
         self.mode = GUIModes.TITLE_SCREEN
 
-        super().__init__(scene, cursorPath)
+        # Loaded before the renderer is made, it picks the UI pipeline and packs the cursors
+        loadConfig()
+        config = bge.logic.globalDict["config"]
+        pipeline = config.get("UI_RENDERER", "auto")
+        ui_atlas.enabled = config.get("UI_ATLAS", True)
+        image_loader.budget_ms = config.get("UI_IMAGE_UPLOAD_MS", image_loader.budget_ms)
+
+        super().__init__(scene, cursorPath, pipeline)
 
     def initializeGUI(self):
         super().initializeGUI()
@@ -103,9 +125,18 @@ class MainGameGUI(BGEImguiWrapper):
         styleConfigPath = f"{getAssetDir()}ui_style.toml"
         styleGUI(styleConfigPath)
 
-        loadConfig()
+        # Decode game sounds in the background while the title screen is up
+        audioManager = getAudioManager()
+        audioManager.attachUpdater(self.imgui_backend.scene)
+        audioManager.preloadDirectory(f"{getAssetDir()}sound")
+        self.playModeMusic()
 
         backend = self.imgui_backend
+        backend.setRetainedOutput(
+            bge.logic.globalDict["config"].get("UI_RETAINED", False))
+        # Debug builds cross-check the GL state cache, mismatches show in the Renderer window
+        if windows.SettingsWindow.START_DEBUG:
+            backend.glState.validate_interval = DEBUG_VALIDATE_INTERVAL
 
         font_global_scaling_factor = 2  # Set to 2 for high res displays?
         backend.setScalingFactors(font_global_scaling_factor, 1.4)
@@ -145,6 +176,11 @@ class MainGameGUI(BGEImguiWrapper):
         self.throttle = windows.ThrottleWindow(io, self)
         self.health = windows.HealthBar(io, self)
         self.timer = windows.TimerWindow(io, self)
+        self.poolStats = windows.PoolStatsWindow(io, self)
+        self.handleStats = windows.HandleStatsWindow(io, self)
+        self.cameraStats = windows.CameraStatsWindow(io, self)
+        self.levelStats = windows.LevelStatsWindow(io, self)
+        self.rendererStats = windows.RendererStatsWindow(io, self)
 
     def drawMainGUI(self):
         self.pauseWindow.drawWindow()
@@ -153,13 +189,31 @@ class MainGameGUI(BGEImguiWrapper):
         self.health.drawWindow()
         self.helpWindow.drawWindow()
         self.timer.drawWindow()
+        self.poolStats.drawWindow()
+        self.handleStats.drawWindow()
+        self.cameraStats.drawWindow()
+        self.levelStats.drawWindow()
+        self.rendererStats.drawWindow()
+
+    def playModeMusic(self):
+        match self.mode:
+            case GUIModes.TITLE_SCREEN:
+                track = TITLE_MUSIC
+            case GUIModes.MAIN_GAME:
+                track = GAME_MUSIC
+            case _:
+                track = None
+
+        if track is not None:
+            track = f"{getAssetDir()}sound/{track}"
+        getAudioManager().playMusic(track)
 
     def updateSceneName(self, name: str):
         self.activeSceneName = name
 
     def togglePause(self):
         sceneStr = self.activeSceneName
-        scene: KX_Scene = bge.logic.getSceneList()[sceneStr]
+        scene: KX_Scene = getScene(sceneStr)
 
         inGame = self.mode is GUIModes.MAIN_GAME
 
@@ -0,0 +1,72 @@
+import bge
+from bge.types import KX_GameObject, KX_Scene
+
+
+class ObjectRegistry:
+    """ Caches scene and object lookups by name for per-frame controllers.
+    Entries are dropped on level loads and scene replacement, and every miss is counted. """
+
+    def __init__(self) -> None:
+        self.scenes: dict[str, KX_Scene] = {}
+        self.objects: dict[tuple[str, str], KX_GameObject] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.missCounts: dict[tuple[str, str], int] = {}
+
+    def getScene(self, sceneName: str) -> KX_Scene:
+        scene = self.scenes.get(sceneName)
+        if scene is None or scene.invalid:
+            scene = bge.logic.getSceneList()[sceneName]
+            self.scenes[sceneName] = scene
+        return scene
+
+    def getObject(self, scene: KX_Scene | str, objName: str) -> KX_GameObject:
+        if isinstance(scene, str):
+            sceneName = scene
+        else:
+            sceneName = scene.name
+
+        key = (sceneName, objName)
+        obj = self.objects.get(key)
+        if obj is not None and not obj.invalid:
+            self.hits += 1
+            return obj
+
+        self.misses += 1
+        self.missCounts[key] = self.missCounts.get(key, 0) + 1
+
+        if isinstance(scene, str):
+            scene = self.getScene(sceneName)
+
+        obj = scene.objects[objName]
+        self.objects[key] = obj
+        return obj
+
+    def invalidateScene(self, sceneName: str):
+        self.scenes.pop(sceneName, None)
+        for key in [key for key in self.objects if key[0] == sceneName]:
+            del self.objects[key]
+
+    def invalidateAll(self):
+        self.scenes.clear()
+        self.objects.clear()
+
+
+registry = ObjectRegistry()
+
+
+def getObject(scene: KX_Scene | str, objName: str) -> KX_GameObject:
+    """ Cached scene.objects[objName], scene can be a KX_Scene or a scene name. """
+    return registry.getObject(scene, objName)
+
+
+def getScene(sceneName: str) -> KX_Scene:
+    """ Cached bge.logic.getSceneList()[sceneName]. """
+    return registry.getScene(sceneName)
+
+
+def replaceScene(scene: KX_Scene, sceneName: str):
+    """ scene.replace() that also drops everything cached for the old scene. """
+    registry.invalidateScene(scene.name)
+    scene.replace(sceneName)
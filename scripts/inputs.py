@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import bge
+
+if TYPE_CHECKING:
+    from .replay import InputRecorder, InputPlayer
+
+mouse = bge.logic.mouse
+keyboard = bge.logic.keyboard
+
+
+class InputSnapshot:
+    """ Merged keyboard + mouse state built once per logic tick and shared by every controller.
+    Actions from globalDict["key_map"] are resolved into bitmasks with pressed/held/released edges. """
+
+    def __init__(self) -> None:
+        self.activeInputs: dict = {}
+        self.mouseDelta = (0.0, 0.0)
+
+        self.actionBits: dict[str, int] = {}
+        self._eventBits: tuple = ()
+        # Key map the bits were resolved from, and its version at the time, see keyMapChanged()
+        self._keyMap: dict | None = None
+        self._keyMapVersion = -1
+        self.keyMapVersion = 0
+
+        self.held = 0
+        self.pressed = 0
+        self.released = 0
+
+        self.built = False
+        self.lastFrameTime = None
+        # getFrameTime() identifies the current tick. Without it a tick is over once a
+        # controller that already read this one asks again, see _newTick()
+        self.useFrameTime = hasattr(bge.logic, "getFrameTime")
+        self.readers: set = set()
+
+        # Settings a replay plays back without touching the saved config, see setting()
+        self.configOverrides: dict = {}
+
+        # Optional record/replay hooks, see replay.py
+        self.recorder: InputRecorder | None = None
+        self.player: InputPlayer | None = None
+
+    def keyMapChanged(self):
+        """ Call after editing globalDict["key_map"] in place. Replacing the dict needs no call. """
+        self.keyMapVersion += 1
+
+    def _resolveKeyMap(self, keyMap: dict):
+        if keyMap is self._keyMap and self.keyMapVersion == self._keyMapVersion:
+            return
+
+        self._keyMap = keyMap
+        self._keyMapVersion = self.keyMapVersion
+        keyMapItems = tuple(keyMap.items())
+        self.actionBits = {action: 1 << index for index,
+                           (action, _) in enumerate(keyMapItems)}
+        self._eventBits = tuple((event, self.actionBits[action])
+                                for action, event in keyMapItems)
+
+        # Bit positions changed, so last tick's mask no longer lines up
+        self.held = 0
+
+    def _newTick(self) -> bool:
+        if self.useFrameTime:
+            frameTime = bge.logic.getFrameTime()
+            if frameTime == self.lastFrameTime:
+                return False
+            self.lastFrameTime = frameTime
+            return True
+
+        try:
+            controller = bge.logic.getCurrentController()
+        except SystemError:
+            # Outside the logic bricks (draw callbacks): never starts a tick of its own
+            controller = None
+
+        if controller is None:
+            return not self.built
+        if controller in self.readers:
+            self.readers.clear()
+            self.readers.add(controller)
+            return True
+
+        self.readers.add(controller)
+        return not self.built
+
+    def update(self):
+        if not self._newTick():
+            return
+        self.built = True
+
+        self._resolveKeyMap(bge.logic.globalDict["key_map"])
+
+        if self.player is not None:
+            # Replayed ticks come from the recording instead of the devices
+            self.activeInputs = {}
+            held = self.player.nextTick(self)
+
+        else:
+            activeInputs = {**keyboard.activeInputs, **mouse.activeInputs}
+            self.activeInputs = activeInputs
+            self.mouseDelta = tuple(mouse.deltaPosition)
+
+            held = 0
+            for event, bit in self._eventBits:
+                if event in activeInputs:
+                    held |= bit
+
+            if self.recorder is not None:
+                self.recorder.record(self, held)
+
+        previous = self.held
+        self.held = held
+        self.pressed = held & ~previous
+        self.released = previous & ~held
+
+    def setting(self, name: str):
+        """ A config value as this tick should see it, a replay's recorded value wins. """
+        if name in self.configOverrides:
+            return self.configOverrides[name]
+        return bge.logic.globalDict["config"][name]
+
+    def bit(self, action: str) -> int:
+        return self.actionBits[action]
+
+    def isHeld(self, action: str) -> bool:
+        return bool(self.held & self.actionBits[action])
+
+    def isPressed(self, action: str) -> bool:
+        return bool(self.pressed & self.actionBits[action])
+
+    def isReleased(self, action: str) -> bool:
+        return bool(self.released & self.actionBits[action])
+
+
+_snapshot = InputSnapshot()
+
+
+def getInputs() -> InputSnapshot:
+    """ Return this tick's input snapshot, building it on the first call of the tick. """
+    _snapshot.update()
+    return _snapshot
@@ -1,8 +1,125 @@
+import time
+
 import bge
 from bge.types import KX_GameObject, KX_Scene, KX_FontObject, SCA_PythonController
 from mathutils import Vector
 
-PERSIST_STR = "persist"
+from .handles import registry, getObject, getScene
+from .loadprofile import LoadLog, LoadProfile, LOG_DIR
+from .manifest import LevelManifest, manifestCache
+from .pool import PoolManager, PREWARM_BUDGET_MS
+
+# Time per frame the streaming loader may spend instantiating the next level
+STREAM_BUDGET_MS = 2.0
+
+ZERO_VECTOR = Vector((0.0, 0.0, 0.0))
+# State bit no logic brick is assigned to. A state can't be 0, hidden objects are moved
+# to this one so their bricks stop running until the level is shown
+HIDDEN_STATE = 1 << 29
+# State scripts set up after the load, dropped on restore so it's rebuilt from scratch
+RESET_PROPERTIES = ("switchCounter",)
+
+
+class LevelSnapshot:
+    """ Dynamic state of a level taken right after it's activated: transform, game properties,
+    mesh, logic state and visibility of the spawned entities and of the level's own objects
+    that run logic (switches), and the level timer. restore() puts back only what changed
+    and reuses the existing instances. """
+
+    def __init__(self, origin: KX_GameObject, spawned: list[KX_GameObject],
+                 manifest: LevelManifest, scene: KX_Scene) -> None:
+        self.origin = origin
+        self.spawned = spawned
+        self.templates = [template for template, _ in manifest.resolve(scene)]
+
+        # [obj, worldTransform, {name: value}, mesh name, state, visible]
+        self.spawnedEntries = [self._capture(obj) for obj in spawned]
+        # Static geometry has no logic to change it
+        self.levelEntries = [self._capture(obj) for obj in origin.childrenRecursive
+                             if len(obj.getPropertyNames()) > 0 or len(obj.controllers) > 0]
+
+        self.timer = getObject(scene, "Timer")
+        self.time = self.timer["time"]
+
+    @staticmethod
+    def _capture(obj: KX_GameObject) -> list:
+        properties = {name: obj[name] for name in obj.getPropertyNames()}
+        meshes = obj.meshes
+        mesh = meshes[0].name if len(meshes) > 0 else None
+        return [obj, obj.worldTransform.copy(), properties, mesh, obj.state, obj.visible]
+
+    @property
+    def restorable(self) -> bool:
+        """ Level geometry can't be recreated piecemeal, if any of it was ended a full reload is needed. """
+        if self.origin.invalid:
+            return False
+        for obj, *_ in self.levelEntries:
+            if obj.invalid:
+                return False
+        return True
+
+    @staticmethod
+    def _restoreEntry(entry: list) -> bool:
+        obj, transform, properties, mesh, state, visible = entry
+        changed = False
+
+        if obj.worldTransform != transform:
+            obj.worldTransform = transform
+            changed = True
+
+        if obj.worldLinearVelocity.length_squared > 0.0:
+            obj.worldLinearVelocity = ZERO_VECTOR
+            changed = True
+        if obj.worldAngularVelocity.length_squared > 0.0:
+            obj.worldAngularVelocity = ZERO_VECTOR
+            changed = True
+
+        for name, value in properties.items():
+            if obj.get(name) != value:
+                obj[name] = value
+                changed = True
+
+        for name in RESET_PROPERTIES:
+            if name in obj and name not in properties:
+                del obj[name]
+                changed = True
+
+        # Replace Mesh actuators (a flipped switch) swap the display and maybe the physics mesh
+        if mesh is not None and obj.meshes[0].name != mesh:
+            obj.replaceMesh(mesh, True, True)
+            changed = True
+
+        if obj.state != state:
+            obj.state = state
+            changed = True
+
+        if obj.visible != visible:
+            obj.setVisible(visible)
+            changed = True
+
+        return changed
+
+    def restore(self, scene: KX_Scene) -> int:
+        """ Returns how many entities had to be touched. Ended spawned entities are added again. """
+        restored = 0
+
+        for index, entry in enumerate(self.spawnedEntries):
+            if entry[0].invalid:
+                newObj: KX_GameObject = scene.addObject(self.templates[index])
+                entry[0] = newObj
+                self.spawned[index] = newObj
+
+            if self._restoreEntry(entry):
+                restored += 1
+
+        for entry in self.levelEntries:
+            if self._restoreEntry(entry):
+                restored += 1
+
+        if not self.timer.invalid:
+            self.timer["time"] = self.time
+
+        return restored
 
 
 class LevelManager:
@@ -11,70 +128,356 @@ class LevelManager:
         self.currentLevel = -1
         self.gameScene = scene
         self.moveObj = scene.objects["ship"]
+        self.poolManager = PoolManager(scene)
+        self.warming = False
+
+        self.levelOrigin: KX_GameObject | None = None
+        self.levelObjects: list[KX_GameObject] = []
+        self.levelManifest: LevelManifest | None = None
+        self.snapshot: LevelSnapshot | None = None
+        self.lastRestoreCount = 0
+
+        # Objects scripts add while the level runs (triggers, effects), ended with it. See track()
+        self.owned: set[KX_GameObject] = set()
+        self.lastTeardownCount = 0
+        self.lastTeardownMs = 0.0
+
+        # Next level being built in the background, see streamLevel()
+        self.streaming = False
+        self.streamLevelNumber = -1
+        self.streamBuilder = None
+        self.streamBudgetMs = STREAM_BUDGET_MS
+        self.pendingOrigin: KX_GameObject | None = None
+        self.pendingManifest: LevelManifest | None = None
+        self.pendingObjects: list[KX_GameObject] = []
+        # [obj, visible, state, dynamics suspended] from before a streamed level was hidden
+        self.pendingStates: list[list] = []
+
+        # Phase timings of the load in progress, only when the PROFILE_LOADS config flag is set
+        self.profile: LoadProfile | None = None
+        self.loadLog: LoadLog | None = None
+
         bge.logic.levelManager = self
         self.loadLevel(self.currentLevel + 1)
 
-    def loadLevel(self, levelNumber: int):
-        self.gameScene.suspend()
-        previousLevel = self.currentLevel
+    def _buildLevel(self, levelNumber: int, hidden: bool):
+        """ Instantiate level_N and replay its spawn manifest into the pending slots, yielding
+        after each addObject so the caller can spread the work over several frames.
+        Hidden levels stay invisible and without physics until _activateLevel(). """
+        levelOriginName = f"level_{levelNumber}"
+        levelOrigin: KX_GameObject = self.gameScene.objectsInactive[levelOriginName]
+
+        newOrigin: KX_GameObject = self.gameScene.addObject(levelOrigin)
+
+        newOrigin.worldPosition = levelOrigin.worldPosition
+        newOrigin.worldOrientation = levelOrigin.worldOrientation
+
+        manifest = manifestCache.get(levelNumber)
+        if manifest is None:
+            manifest = manifestCache.index(levelNumber, newOrigin)
+
+        self.pendingOrigin = newOrigin
+        self.pendingManifest = manifest
+        self.pendingObjects = []
+        self.pendingStates = []
+
+        if hidden:
+            self._hide(newOrigin)
+
+        yield
+
+        # Spawn in level objects/entities
+        for referenceObj, transform in manifest.resolve(self.gameScene):
+            newObj: KX_GameObject = self.gameScene.addObject(referenceObj)
+            newObj.worldTransform = transform
+
+            if hidden:
+                self._hide(newObj)
+
+            self.pendingObjects.append(newObj)
+            yield
+
+    def _hide(self, root: KX_GameObject):
+        """ Hide root and its children one by one, parking their logic bricks and physics,
+        and remember how each was so _activateLevel() can put back exactly that.
+        The engine can't tell whether physics is suspended, but these objects were added
+        in this same call, so it's always live and restorePhysics() puts it back as it was. """
+        for obj in [root, *root.childrenRecursive]:
+            self.pendingStates.append([obj, obj.visible, obj.state, obj.isSuspendDynamics])
+            obj.setVisible(False)
+            obj.state = HIDDEN_STATE
+            obj.suspendPhysics()
+
+    def _teardownLevel(self):
+        start = time.perf_counter()
+
+        # Return in-flight pooled objects before the old level goes away
+        # (they are persistent, so the pools survive the teardown below)
+        self.poolManager.releaseAll()
+
+        # Only what the level owns is ended, the origin takes its children with it
+        count = self._endOwned()
+        for entity in self.levelObjects:
+            if not entity.invalid:
+                entity.endObject()
+                count += 1
 
-        if previousLevel != -1:
-            for entity in self.gameScene.objects:
-                if entity.parent is None:
-                    if PERSIST_STR not in entity:
-                        entity.endObject()
+        if self.levelOrigin is not None and not self.levelOrigin.invalid:
+            self.levelOrigin.endObject()
+            count += 1
+        self.levelOrigin = None
+        self.levelObjects = []
+        self.snapshot = None
 
-            prevLevelOriginName = f"level_{previousLevel}"
-            prevLevelOrigin: KX_GameObject = self.gameScene.objects[prevLevelOriginName]
-            prevLevelOrigin.endObject()
+        self.lastTeardownCount = count
+        self.lastTeardownMs = (time.perf_counter() - start) * 1000.0
 
-        nextLevel = levelNumber
+        # Cached handles may point at objects that were just ended
+        registry.invalidateScene(self.gameScene.name)
 
-        nextLevelOriginName = f"level_{nextLevel}"
-        nextLevelOrigin: KX_GameObject = self.gameScene.objectsInactive[nextLevelOriginName]
+    def _beginProfile(self, levelNumber: int, kind: str):
+        config = bge.logic.globalDict.get("config", {})
+        if not config.get("PROFILE_LOADS", False):
+            self.profile = None
+            return
 
-        newOrigin: KX_GameObject = self.gameScene.addObject(
-            nextLevelOrigin)
+        if self.loadLog is None:
+            self.loadLog = LoadLog(bge.logic.expandPath(f"//{LOG_DIR}"))
+        self.profile = LoadProfile(levelNumber, kind, self.gameScene)
 
-        newOrigin.worldPosition = nextLevelOrigin.worldPosition
-        newOrigin.worldOrientation = nextLevelOrigin.worldOrientation
+    def _mark(self, phase: str):
+        if self.profile is not None:
+            self.profile.mark(phase)
 
-        for child in newOrigin.children:
-            if "spawnPoint" in child:
-                spawnPoint = child
-                break
+    def _resumeProfile(self):
+        if self.profile is not None:
+            self.profile.resume()
 
-        ship = self.gameScene.objects["ship"]
+    def _endProfile(self):
+        if self.profile is not None:
+            self.loadLog.write(self.profile)
+            self.profile = None
 
-        ship.worldPosition = spawnPoint.worldPosition
-        ship.worldOrientation = spawnPoint.worldOrientation
+    def track(self, obj: KX_GameObject):
+        """ Hand obj to the current level, it's ended on the next teardown or respawn.
+        Add Object actuators can't call this, what they spawn (enemy lasers) isn't tracked
+        and has to end itself through its own logic bricks. """
+        self.owned.add(obj)
+
+    def _endOwned(self) -> int:
+        count = 0
+        for obj in self.owned:
+            if not obj.invalid:
+                obj.endObject()
+                count += 1
+        self.owned.clear()
+        return count
+
+    def _activateLevel(self, levelNumber: int, hidden: bool):
+        newOrigin = self.pendingOrigin
+
+        if hidden:
+            for obj, visible, state, dynamicsSuspended in self.pendingStates:
+                if obj.invalid:
+                    continue
+                obj.setVisible(visible)
+                obj.state = state
+                obj.restorePhysics()
+                if dynamicsSuspended:
+                    obj.suspendDynamics()
+            self._mark("activate")
+
+        self.levelOrigin = newOrigin
+        self.levelObjects = self.pendingObjects
+        self.levelManifest = self.pendingManifest
+        self._resetShip()
+        self._mark("ship")
+
+        self.snapshot = LevelSnapshot(
+            newOrigin, self.levelObjects, self.levelManifest, self.gameScene)
+        self._mark("snapshot")
+
+        self.pendingOrigin = None
+        self.pendingManifest = None
+        self.pendingObjects = []
+        self.pendingStates = []
+
+        self.currentLevel = levelNumber
+
+    def _resetShip(self):
+        spawnPoint = self.levelManifest.spawnPoint
+        ship = getObject(self.gameScene, "ship")
+
+        ship.worldPosition = spawnPoint.to_translation()
+        ship.worldOrientation = spawnPoint.to_quaternion().to_matrix()
         ship["throttle"] = 0.0
         ship["health"] = 100.0
+        if "flightPose" in ship:
+            ship["flightPose"].snap(ship)
 
-        # Spawn in level objects/entities
-        for obj in newOrigin.childrenRecursive:
-            if "spawn" in obj:
-                referenceObj = self.gameScene.objectsInactive[obj["spawn"]]
-                newObj: KX_GameObject = self.gameScene.addObject(
-                    referenceObj, obj, 0)
-                newObj.worldTransform = obj.worldTransform
+    def loadLevel(self, levelNumber: int, kind: str = "load"):
+        """ Synchronous load, the game is suspended until the level and pools are ready. """
+        self.cancelStreaming()
+        self._beginProfile(levelNumber, kind)
 
-        self.currentLevel = levelNumber
+        self.gameScene.suspend()
+        self._mark("suspend")
 
-        self.gameScene.resume()
+        if self.currentLevel != -1:
+            self._teardownLevel()
+            self._mark("teardown")
+
+        builder = self._buildLevel(levelNumber, False)
+        next(builder)
+        self._mark("origin")
+        for _ in builder:
+            pass
+        self._mark("spawn")
+
+        self._activateLevel(levelNumber, False)
+        self._startGame()
+
+    def _startGame(self):
+        # Keep the game suspended until every registered pool is warm,
+        # finishing the work in small slices on the overlay's draw callback
+        if self.prewarmPools() < 1.0:
+            self.gameScene.suspend()
+            if not self.warming:
+                self.warming = True
+                overlay = getScene("overlay")
+                overlay.pre_draw.append(self.continueWarming)
+            return
+
+        self.finishLoad()
+
+    def streamLevel(self, levelNumber: int):
+        """ Build levelNumber over the next frames while the current level keeps running,
+        then swap to it in a single frame. """
+        if self.streaming:
+            if self.streamLevelNumber == levelNumber:
+                return
+            self.cancelStreaming()
+
+        self._beginProfile(levelNumber, "stream")
+
+        self.streaming = True
+        self.streamLevelNumber = levelNumber
+        self.streamBuilder = None
+
+        overlay = getScene("overlay")
+        overlay.pre_draw.append(self.continueStreaming)
+
+    def continueStreaming(self):
+        """ Overlay pre_draw callback. Takes no arguments: the scene passes its camera to
+        callbacks that accept one, the frame's budget is streamBudgetMs. """
+        self._resumeProfile()
 
-        overlay = bge.logic.getSceneList()["overlay"]
-        text: KX_FontObject = overlay.objects["LevelText"]
+        deadline = time.perf_counter() + self.streamBudgetMs / 1000.0
+
+        if self.streamBuilder is None:
+            self.streamBuilder = self._buildLevel(self.streamLevelNumber, True)
+            next(self.streamBuilder)
+            self._mark("origin")
+
+        for _ in self.streamBuilder:
+            if time.perf_counter() >= deadline:
+                self._mark("spawn")
+                return
+        self._mark("spawn")
+
+        # Everything is instantiated: swap levels within this frame
+        self._stopStreaming()
+        self._teardownLevel()
+        self._mark("teardown")
+        self._activateLevel(self.streamLevelNumber, True)
+        self._startGame()
+
+    def _stopStreaming(self):
+        overlay = getScene("overlay")
+        if self.continueStreaming in overlay.pre_draw:
+            overlay.pre_draw.remove(self.continueStreaming)
+
+        self.streaming = False
+        self.streamBuilder = None
+
+    def cancelStreaming(self):
+        """ Drop a half built level, the current one is left untouched. """
+        if not self.streaming:
+            return
+
+        self._stopStreaming()
+        self.profile = None
+
+        for obj in self.pendingObjects:
+            if not obj.invalid:
+                obj.endObject()
+        if self.pendingOrigin is not None and not self.pendingOrigin.invalid:
+            self.pendingOrigin.endObject()
+
+        self.pendingOrigin = None
+        self.pendingManifest = None
+        self.pendingObjects = []
+        self.pendingStates = []
+
+    def finishLoad(self):
+        text: KX_FontObject = getObject("overlay", "LevelText")
         text["OriginalText"] = f"Level {self.currentLevel}"
         text["ResetReveal"] = True
         text["disappear"] = 0.0
         text.setVisible(True)
+        self._mark("text")
+
+        self.gameScene.resume()
+        self._mark("resume")
+        self._endProfile()
+
+    def prewarmPools(self, budgetMs: float = PREWARM_BUDGET_MS) -> float:
+        return self.poolManager.prewarm(budgetMs)
+
+    @property
+    def warmProgress(self) -> float:
+        return self.poolManager.warmProgress
+
+    def continueWarming(self):
+        self._resumeProfile()
+        progress = self.prewarmPools()
+        self._mark("warm")
+        if progress < 1.0:
+            return
+
+        overlay = getScene("overlay")
+        overlay.pre_draw.remove(self.continueWarming)
+        self.warming = False
+        self.finishLoad()
+
+    def restoreSnapshot(self) -> bool:
+        """ Put the current level back the way it was loaded without rebuilding it.
+        Returns False when it can't be done in place. """
+        snapshot = self.snapshot
+        if snapshot is None or not snapshot.restorable:
+            return False
+
+        self._beginProfile(self.currentLevel, "respawn")
+
+        self.poolManager.releaseAll()
+        self._endOwned()
+        self._mark("teardown")
+
+        self.lastRestoreCount = snapshot.restore(self.gameScene)
+        self._mark("restore")
+
+        self._resetShip()
+        self._mark("ship")
+        self.finishLoad()
+        return True
 
     def respawn(self):
-        self.loadLevel(self.currentLevel)
+        self.cancelStreaming()
+        if not self.restoreSnapshot():
+            self.loadLevel(self.currentLevel, "reload")
 
     def loadNextLevel(self):
-        self.loadLevel(self.currentLevel + 1)
+        self.streamLevel(self.currentLevel + 1)
 
 
 def levelTextDisappear(cont: SCA_PythonController):
@@ -0,0 +1,153 @@
+""" Level load timing. LevelManager fills a LoadProfile per load when the PROFILE_LOADS
+config flag is set, and each finished profile becomes one JSON line in a rotating log.
+
+Running this file summarizes those logs across sessions:
+
+    python scripts/loadprofile.py [log directory]
+"""
+import glob
+import logging
+import os
+import sys
+import time
+import uuid
+from logging.handlers import RotatingFileHandler
+
+import orjson
+
+LOG_DIR = "logs"
+LOG_NAME = "level_loads.jsonl"
+LOG_MAX_BYTES = 512 * 1024
+LOG_BACKUPS = 5
+
+# Phases in the order a load goes through them, used to order the summary
+PHASES = ("suspend", "teardown", "origin", "spawn", "restore", "activate", "ship",
+          "snapshot", "warm", "text", "resume")
+
+SESSION_ID = uuid.uuid4().hex[:8]
+
+
+class LoadProfile:
+    """ Wall time and scene object count per phase of one level load.
+    mark(phase) closes the phase that has been running since the previous mark. """
+
+    def __init__(self, levelNumber: int, kind: str, scene) -> None:
+        self.levelNumber = levelNumber
+        self.kind = kind
+        self.scene = scene
+
+        self.startTime = time.perf_counter()
+        self.lastMark = self.startTime
+        self.busyTime = 0.0
+        self.frames = 1
+
+        # phase -> [seconds, objects in the scene when the phase ended]
+        self.phases: dict[str, list] = {}
+
+    def resume(self):
+        """ Restart the phase clock after waiting for the next frame, the wait isn't counted. """
+        self.lastMark = time.perf_counter()
+        self.frames += 1
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        elapsed = now - self.lastMark
+        self.lastMark = now
+        self.busyTime += elapsed
+
+        entry = self.phases.setdefault(phase, [0.0, 0])
+        entry[0] += elapsed
+        entry[1] = len(self.scene.objects)
+
+    def record(self) -> dict:
+        return {
+            "session": SESSION_ID,
+            "time": time.time(),
+            "level": self.levelNumber,
+            "kind": self.kind,
+            "frames": self.frames,
+            "totalMs": self.busyTime * 1000.0,
+            "wallMs": (time.perf_counter() - self.startTime) * 1000.0,
+            "phases": {phase: {"ms": seconds * 1000.0, "objects": objects}
+                       for phase, (seconds, objects) in self.phases.items()},
+        }
+
+
+class LoadLog:
+    """ Appends finished profiles to a size-rotated JSON lines file. """
+
+    def __init__(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+
+        self.logger = logging.getLogger(f"{__name__}.loads")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+
+        if len(self.logger.handlers) == 0:
+            handler = RotatingFileHandler(
+                os.path.join(directory, LOG_NAME), maxBytes=LOG_MAX_BYTES,
+                backupCount=LOG_BACKUPS, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.logger.addHandler(handler)
+
+    def write(self, profile: LoadProfile):
+        self.logger.info(orjson.dumps(profile.record()).decode())
+
+
+def readRecords(directory: str) -> list[dict]:
+    records = []
+    for path in sorted(glob.glob(os.path.join(directory, f"{LOG_NAME}*"))):
+        with open(path, "rb") as infile:
+            for line in infile:
+                line = line.strip()
+                if len(line) > 0:
+                    try:
+                        records.append(orjson.loads(line))
+                    except orjson.JSONDecodeError:
+                        continue
+    return records
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(records: list[dict]) -> str:
+    """ Load times per (level, kind): counts, mean/median/p95/max and mean time per phase. """
+    groups: dict[tuple[int, str], list[dict]] = {}
+    for record in records:
+        groups.setdefault((record["level"], record["kind"]), []).append(record)
+
+    lines = []
+    for (level, kind), group in sorted(groups.items()):
+        totals = [record["totalMs"] for record in group]
+        sessions = len({record["session"] for record in group})
+        lines.append(
+            f"level {level} {kind}: {len(group)} loads over {sessions} sessions, "
+            f"mean {sum(totals) / len(totals):.2f} ms, median {percentile(totals, 0.5):.2f} ms, "
+            f"p95 {percentile(totals, 0.95):.2f} ms, max {max(totals):.2f} ms")
+
+        phaseNames = {phase for record in group for phase in record["phases"]}
+        for phase in sorted(phaseNames, key=lambda name: PHASES.index(name) if name in PHASES else len(PHASES)):
+            samples = [record["phases"][phase] for record in group if phase in record["phases"]]
+            meanMs = sum(sample["ms"] for sample in samples) / len(samples)
+            objects = samples[-1]["objects"]
+            lines.append(f"    {phase:<10} {meanMs:8.2f} ms  ({objects} objects)")
+
+    return "\n".join(lines)
+
+
+def main(argv: list[str]) -> int:
+    directory = argv[1] if len(argv) > 1 else LOG_DIR
+    records = readRecords(directory)
+    if len(records) == 0:
+        print(f"No level load records in {directory}")
+        return 1
+
+    print(summarize(records))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
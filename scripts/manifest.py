@@ -0,0 +1,137 @@
+import os
+
+import bge
+from bge.types import KX_GameObject, KX_Scene
+from mathutils import Matrix
+import orjson
+
+# Spawn manifests are only valid for the blend file they were indexed from
+BLEND_FILE_PATH = "//game.range"
+MANIFEST_CACHE_PATH = "//assets/spawn_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def matrixToList(matrix: Matrix) -> list[list[float]]:
+    return [list(row) for row in matrix]
+
+
+class LevelManifest:
+    """ What a load of level_N needs: the spawn point transform and every entity to spawn,
+    as (template name, world transform) in spawn order. """
+
+    def __init__(self, spawnPoint: Matrix, spawns: list[tuple[str, Matrix]]) -> None:
+        self.spawnPoint = spawnPoint
+        self.spawns = spawns
+
+        self._scene: KX_Scene | None = None
+        self._resolved: list[tuple[KX_GameObject, Matrix]] = []
+
+    @classmethod
+    def fromOrigin(cls, origin: KX_GameObject) -> "LevelManifest":
+        """ Index an instantiated level origin, the only walk over its children. """
+        spawnPoint = None
+        for child in origin.children:
+            if "spawnPoint" in child:
+                spawnPoint = child.worldTransform.copy()
+                break
+
+        spawns = [(obj["spawn"], obj.worldTransform.copy())
+                  for obj in origin.childrenRecursive if "spawn" in obj]
+
+        return cls(spawnPoint, spawns)
+
+    @classmethod
+    def fromDict(cls, data: dict) -> "LevelManifest":
+        return cls(Matrix(data["spawnPoint"]),
+                   [(name, Matrix(transform)) for name, transform in data["spawns"]])
+
+    def toDict(self) -> dict:
+        return {
+            "spawnPoint": matrixToList(self.spawnPoint),
+            "spawns": [[name, matrixToList(transform)] for name, transform in self.spawns],
+        }
+
+    def resolve(self, scene: KX_Scene) -> list[tuple[KX_GameObject, Matrix]]:
+        """ Spawn entries with their templates looked up in scene.objectsInactive,
+        resolved once per scene. """
+        if self._scene is not scene or scene.invalid:
+            objectsInactive = scene.objectsInactive
+            self._resolved = [(objectsInactive[name], transform)
+                              for name, transform in self.spawns]
+            self._scene = scene
+
+        return self._resolved
+
+
+class ManifestCache:
+    """ Level manifests kept in memory and mirrored to MANIFEST_CACHE_PATH.
+    The disk copy is thrown away when the blend file's mtime changes. """
+
+    def __init__(self) -> None:
+        self.manifests: dict[int, LevelManifest] = {}
+        self.blendMtime: float | None = None
+        self.loaded = False
+
+        self.hits = 0
+        self.misses = 0
+
+    def _cachePath(self) -> str:
+        return bge.logic.expandPath(MANIFEST_CACHE_PATH)
+
+    def _load(self):
+        self.loaded = True
+
+        blendPath = bge.logic.expandPath(BLEND_FILE_PATH)
+        if not os.path.exists(blendPath):
+            return
+        self.blendMtime = os.path.getmtime(blendPath)
+
+        try:
+            with open(self._cachePath(), "rb") as infile:
+                data = orjson.loads(infile.read())
+        except (OSError, orjson.JSONDecodeError):
+            return
+
+        if data.get("version") != MANIFEST_VERSION or data.get("mtime") != self.blendMtime:
+            return
+
+        for levelNumber, levelData in data["levels"].items():
+            self.manifests[int(levelNumber)] = LevelManifest.fromDict(levelData)
+
+    def _save(self):
+        if self.blendMtime is None:
+            return
+
+        data = {
+            "version": MANIFEST_VERSION,
+            "mtime": self.blendMtime,
+            "levels": {str(levelNumber): manifest.toDict()
+                       for levelNumber, manifest in self.manifests.items()},
+        }
+
+        try:
+            with open(self._cachePath(), "wb") as outfile:
+                outfile.write(orjson.dumps(data))
+        except OSError:
+            pass
+
+    def get(self, levelNumber: int) -> LevelManifest | None:
+        if not self.loaded:
+            self._load()
+
+        manifest = self.manifests.get(levelNumber)
+        if manifest is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return manifest
+
+    def index(self, levelNumber: int, origin: KX_GameObject) -> LevelManifest:
+        """ Build level levelNumber's manifest from its instantiated origin and store it. """
+        manifest = LevelManifest.fromOrigin(origin)
+        self.manifests[levelNumber] = manifest
+        self._save()
+        return manifest
+
+
+manifestCache = ManifestCache()
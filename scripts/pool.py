@@ -1,10 +1,85 @@
+import time
+from collections import deque
+
+import bge
 from bge.types import KX_GameObject, KX_Scene
 
+# Game property marking objects that outlive level changes (LevelManager only ends what a level owns)
+PERSIST_STR = "persist"
+
+# Default time slice (in milliseconds) a single prewarm call may spend creating objects
+PREWARM_BUDGET_MS = 2.0
+
+# Handles pack a slot index in the low bits and the slot's generation above it
+HANDLE_SLOT_BITS = 16
+HANDLE_SLOT_MASK = (1 << HANDLE_SLOT_BITS) - 1
+INVALID_HANDLE = -1
+
+# How many frames of per-frame pool counters to keep for the debug overlay
+STATS_WINDOW_FRAMES = 240
+
+# Total number of pooled objects (active + free) the PoolManager tries to stay under
+DEFAULT_OBJECT_BUDGET = 200
+# Free lists of pools that haven't handed out an object for this long are trimmed to their warm target
+IDLE_TRIM_SECONDS = 10.0
+
+POOL_STAT_NAMES = ("hits", "misses", "allocations", "overflowDiscards",
+                   "invalidSkipped", "physicsTime")
+
+
+class PoolStats:
+    """ Counters for sizing a pool. Totals since creation plus a rolling per-frame window. """
+
+    def __init__(self, windowSize: int = STATS_WINDOW_FRAMES) -> None:
+        # Acquires served from the free list vs. ones that had to create an object
+        self.hits = 0
+        self.misses = 0
+        # Every scene.addObject done by the pool (including prewarming)
+        self.allocations = 0
+        # Released objects ended because the free list was already at maxSize
+        self.overflowDiscards = 0
+        # Free objects found already ended (e.g. by a level teardown)
+        self.invalidSkipped = 0
+        self.highWaterMark = 0
+        # Seconds spent in restorePhysics/suspendPhysics
+        self.physicsTime = 0.0
+
+        self.history: dict[str, deque] = {
+            name: deque(maxlen=windowSize) for name in POOL_STAT_NAMES}
+        self.history["active"] = deque(maxlen=windowSize)
+
+        self._lastTotals = self._totals()
+
+    def _totals(self) -> tuple:
+        return tuple(getattr(self, name) for name in POOL_STAT_NAMES)
+
+    @property
+    def hitRate(self) -> float:
+        acquires = self.hits + self.misses
+        if acquires == 0:
+            return 1.0
+        return self.hits / acquires
+
+    def endFrame(self, activeCount: int):
+        """ Push this frame's counter deltas into the rolling window. """
+        totals = self._totals()
+        for name, current, last in zip(POOL_STAT_NAMES, totals, self._lastTotals):
+            self.history[name].append(current - last)
+        self.history["active"].append(activeCount)
+        self._lastTotals = totals
+
+    def snapshot(self) -> dict:
+        data = {name: getattr(self, name) for name in POOL_STAT_NAMES}
+        data["highWaterMark"] = self.highWaterMark
+        data["hitRate"] = self.hitRate
+        return data
+
 
 class ObjectPool:
     def __init__(self, scene: KX_Scene, reference: KX_GameObject,
                  objName: str, maxSize: int, inactivePosition: float | None = None,
-                 duplicateMesh: bool = False, usePhysics: bool = False) -> None:
+                 duplicateMesh: bool = False, usePhysics: bool = False,
+                 persistent: bool = False, ghost: bool = False) -> None:
         self.scene = scene
         self.objName = objName
         self.reference = reference
@@ -13,49 +88,337 @@ class ObjectPool:
         self.inactivePosition = inactivePosition
         self.duplicateMesh = duplicateMesh
         self.usePhysics = usePhysics
+        self.persistent = persistent
+        # Objects never get physics back, e.g. visual proxies moved by script
+        self.ghost = ghost
+
+        # Slot arrays, indexed by the low bits of a handle
+        self.objects: list[KX_GameObject | None] = []
+        self.generations: list[int] = []
+        self.active: list[bool] = []
 
-        self.currentPoolID = 0
+        # Slots holding a parked object (longest parked first), and slots whose object was discarded
+        self.freeSlots: deque[int] = deque()
+        self.emptySlots: list[int] = []
 
-        self.activeObjects: dict[int, KX_GameObject] = {}
-        self.freeObjects: list[KX_GameObject] = []
+        self.activeCount = 0
 
         self.maxSize = maxSize
 
-    def getObject(self) -> KX_GameObject:
-        if len(self.freeObjects) < 1:
-            newObj = self.scene.addObject(self.objName, self.reference, 0.0)
-            newObj["pool"] = self
-            newObj["poolID"] = self.currentPoolID
-            self.currentPoolID += 1
+        # Number of objects prewarm() tries to keep around
+        self.warmTarget = 0
+
+        self.stats = PoolStats()
+
+        # perf_counter() time of the last acquire, used for LRU trimming
+        self.lastUsed = time.perf_counter()
 
-            if self.duplicateMesh:
-                newMesh = newObj.meshes[0].copy()
-                newObj.replaceMesh(newMesh, True, True)
+    def _createObject(self) -> int:
+        newObj = self.scene.addObject(self.objName, self.reference, 0.0)
+        newObj["pool"] = self
+        # Parked objects may still trigger removeBullet, give them a handle that's always stale
+        newObj["poolHandle"] = INVALID_HANDLE
+        if self.persistent:
+            newObj[PERSIST_STR] = True
+        if self.ghost:
+            newObj.suspendPhysics()
+        self.stats.allocations += 1
 
+        if self.duplicateMesh:
+            newMesh = newObj.meshes[0].copy()
+            newObj.replaceMesh(newMesh, True, True)
+
+        if len(self.emptySlots) > 0:
+            slot = self.emptySlots.pop()
+            self.objects[slot] = newObj
         else:
-            newObj = self.freeObjects.pop()
-            if newObj.invalid:
-                return self.getObject()
+            slot = len(self.objects)
+            self.objects.append(newObj)
+            self.generations.append(0)
+            self.active.append(False)
 
-            if self.usePhysics:
-                newObj.restorePhysics()
+        return slot
 
-        self.activeObjects[newObj["poolID"]] = newObj
+    def _parkObject(self, obj: KX_GameObject):
+        if self.inactivePosition is not None:
+            obj.worldPosition.z = self.inactivePosition
 
-        return newObj
+        if self.usePhysics:
+            start = time.perf_counter()
+            obj.suspendPhysics()
+            self.stats.physicsTime += time.perf_counter() - start
 
-    def removeObject(self, obj: KX_GameObject):
+    def _discardSlot(self, slot: int):
+        self.objects[slot] = None
+        self.emptySlots.append(slot)
 
-        del self.activeObjects[obj["poolID"]]
+    def acquire(self) -> int:
+        """ Take an object out of the pool (creating one if needed) and return its handle. """
+        objects = self.objects
+        freeSlots = self.freeSlots
+        stats = self.stats
+        self.lastUsed = time.perf_counter()
 
-        if len(self.freeObjects) < self.maxSize:
-            if self.inactivePosition is not None:
-                obj.worldPosition.z = self.inactivePosition
+        while len(freeSlots) > 0:
+            slot = freeSlots.pop()
+            obj = objects[slot]
+            if obj.invalid:
+                stats.invalidSkipped += 1
+                self._discardSlot(slot)
+                continue
 
             if self.usePhysics:
-                obj.suspendPhysics()
+                start = time.perf_counter()
+                obj.restorePhysics()
+                stats.physicsTime += time.perf_counter() - start
+            stats.hits += 1
+            break
+
+        else:
+            slot = self._createObject()
+            stats.misses += 1
+
+        self.active[slot] = True
+        self.activeCount += 1
+        if self.activeCount > stats.highWaterMark:
+            stats.highWaterMark = self.activeCount
+
+        return (self.generations[slot] << HANDLE_SLOT_BITS) | slot
+
+    def getObject(self) -> KX_GameObject:
+        handle = self.acquire()
+        obj = self.objects[handle & HANDLE_SLOT_MASK]
+        obj["poolHandle"] = handle
+
+        return obj
+
+    def isValid(self, handle: int) -> bool:
+        slot = handle & HANDLE_SLOT_MASK
+        return (handle >= 0 and slot < len(self.objects) and self.active[slot]
+                and self.generations[slot] == (handle >> HANDLE_SLOT_BITS))
 
-            self.freeObjects.append(obj)
+    def objectFor(self, handle: int) -> KX_GameObject | None:
+        if not self.isValid(handle):
+            return None
+        return self.objects[handle & HANDLE_SLOT_MASK]
+
+    def release(self, handle: int) -> bool:
+        """ Return the object behind handle to the pool. Stale handles are ignored and return False. """
+        if not self.isValid(handle):
+            return False
+
+        slot = handle & HANDLE_SLOT_MASK
+        self.active[slot] = False
+        self.generations[slot] += 1
+        self.activeCount -= 1
+
+        obj = self.objects[slot]
+
+        if obj.invalid:
+            self._discardSlot(slot)
+
+        elif len(self.freeSlots) < self.maxSize:
+            self._parkObject(obj)
+            self.freeSlots.append(slot)
 
         else:
             obj.endObject()
+            self._discardSlot(slot)
+            self.stats.overflowDiscards += 1
+
+        return True
+
+    def removeObject(self, obj: KX_GameObject) -> bool:
+        return self.release(obj["poolHandle"])
+
+    def releaseAll(self):
+        """ Return every active object to the pool at once, e.g. on level teardown. """
+        generations = self.generations
+        for slot, isActive in enumerate(self.active):
+            if isActive:
+                self.release((generations[slot] << HANDLE_SLOT_BITS) | slot)
+
+    def trimFree(self, count: int) -> int:
+        """ End up to count parked objects, returns how many were removed. """
+        trimmed = 0
+        while trimmed < count and len(self.freeSlots) > 0:
+            slot = self.freeSlots.popleft()
+            obj = self.objects[slot]
+            if not obj.invalid:
+                obj.endObject()
+            self._discardSlot(slot)
+            trimmed += 1
+
+        return trimmed
+
+    def _pruneInvalid(self):
+        # Objects ended outside the pool (e.g. by a level teardown) free up their slots
+        objects = self.objects
+
+        validFree = []
+        for slot in self.freeSlots:
+            if objects[slot].invalid:
+                self.stats.invalidSkipped += 1
+                self._discardSlot(slot)
+            else:
+                validFree.append(slot)
+        self.freeSlots = deque(validFree)
+
+        for slot, isActive in enumerate(self.active):
+            if isActive and objects[slot].invalid:
+                self.active[slot] = False
+                self.generations[slot] += 1
+                self.activeCount -= 1
+                self._discardSlot(slot)
+
+    def endFrame(self):
+        """ Close the current frame in the stats window, call once per logic tick. """
+        self.stats.endFrame(self.activeCount)
+
+    def setWarmTarget(self, count: int):
+        """ Set how many objects prewarm() should fill the pool up to (capped at maxSize). """
+        self.warmTarget = min(count, self.maxSize)
+
+    def prewarm(self, budgetMs: float = PREWARM_BUDGET_MS, limit: int | None = None) -> float:
+        """ Create parked objects until the warm target is reached, budgetMs runs out or limit
+        objects were created. Call it during level load or idle frames, returns the current warmProgress. """
+
+        self._pruneInvalid()
+
+        deadline = time.perf_counter() + (budgetMs / 1000.0)
+        created = 0
+
+        while self.warmCount < self.warmTarget and (limit is None or created < limit):
+            slot = self._createObject()
+            self._parkObject(self.objects[slot])
+            self.freeSlots.append(slot)
+            created += 1
+
+            if time.perf_counter() >= deadline:
+                break
+
+        return self.warmProgress
+
+    @property
+    def warmCount(self) -> int:
+        return len(self.freeSlots) + self.activeCount
+
+    @property
+    def warmProgress(self) -> float:
+        if self.warmTarget <= 0:
+            return 1.0
+        return min(1.0, self.warmCount / self.warmTarget)
+
+    @property
+    def isWarm(self) -> bool:
+        return self.warmProgress >= 1.0
+
+
+class PoolManager:
+    """ Scene-level registry of object pools keyed by object name, shared by every emitter.
+    Pooled objects are never owned by a level, so the pools survive LevelManager.loadLevel. """
+
+    def __init__(self, scene: KX_Scene, objectBudget: int = DEFAULT_OBJECT_BUDGET) -> None:
+        self.scene = scene
+        self.objectBudget = objectBudget
+        self.pools: dict[str, ObjectPool] = {}
+        self.caps: dict[str, int] = {}
+
+        bge.logic.poolManager = self
+        scene.post_draw.append(self.endFrame)
+
+    def getPool(self, objName: str, reference: KX_GameObject, maxSize: int,
+                inactivePosition: float | None = None, duplicateMesh: bool = False,
+                usePhysics: bool = False, warmCount: int = 0, key: str | None = None,
+                ghost: bool = False) -> ObjectPool:
+        """ Fetch the shared pool for objName, creating it on first use.
+        Pass a key to keep a separately configured pool of the same object. """
+        if key is None:
+            key = objName
+
+        if key in self.pools:
+            pool = self.pools[key]
+            # The emitter that created the pool may be gone, spawn relative to the new one
+            if pool.reference.invalid:
+                pool.reference = reference
+        else:
+            if key in self.caps:
+                maxSize = min(maxSize, self.caps[key])
+
+            pool = ObjectPool(self.scene, reference, objName, maxSize, inactivePosition,
+                              duplicateMesh, usePhysics, persistent=True, ghost=ghost)
+            self.pools[key] = pool
+
+        if warmCount > pool.warmTarget:
+            pool.setWarmTarget(warmCount)
+
+        return pool
+
+    def setCap(self, key: str, cap: int):
+        """ Limit how many free objects of one type may be kept around. """
+        self.caps[key] = cap
+        if key in self.pools:
+            pool = self.pools[key]
+            pool.maxSize = cap
+            pool.warmTarget = min(pool.warmTarget, cap)
+            pool.trimFree(len(pool.freeSlots) - cap)
+
+    @property
+    def objectCount(self) -> int:
+        return sum(pool.warmCount for pool in self.pools.values())
+
+    def trim(self):
+        """ Trim idle free lists, least recently used first, and stay under the object budget. """
+        now = time.perf_counter()
+        lruPools = sorted(self.pools.values(), key=lambda pool: pool.lastUsed)
+
+        for pool in lruPools:
+            if now - pool.lastUsed > IDLE_TRIM_SECONDS:
+                pool.trimFree(pool.warmCount - pool.warmTarget)
+
+        excess = self.objectCount - self.objectBudget
+        for pool in lruPools:
+            if excess <= 0:
+                break
+            excess -= pool.trimFree(excess)
+
+    def releaseAll(self):
+        for pool in self.pools.values():
+            pool.releaseAll()
+
+    def prewarm(self, budgetMs: float = PREWARM_BUDGET_MS) -> float:
+        """ Spend up to budgetMs warming every pool, returns the overall progress. """
+        if len(self.pools) < 1:
+            return 1.0
+
+        progress = 0.0
+        for pool in self.pools.values():
+            # Objects left under the budget, the pool may create at most that many
+            remaining = self.objectBudget - self.objectCount
+            if pool.reference.invalid or remaining <= 0:
+                # Can't spawn anything more for this pool right now
+                progress += 1.0
+            else:
+                progress += pool.prewarm(budgetMs / len(self.pools), remaining)
+
+        return progress / len(self.pools)
+
+    @property
+    def warmProgress(self) -> float:
+        if len(self.pools) < 1:
+            return 1.0
+        return sum(pool.warmProgress for pool in self.pools.values()) / len(self.pools)
+
+    @property
+    def isWarm(self) -> bool:
+        return all(pool.isWarm for pool in self.pools.values())
+
+    def endFrame(self):
+        for pool in self.pools.values():
+            pool.endFrame()
+
+        # Fill pools on idle frames so the first volley doesn't spawn objects
+        if not self.isWarm:
+            self.prewarm()
+
+        self.trim()
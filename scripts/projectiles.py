@@ -0,0 +1,125 @@
+from typing import Callable
+
+from bge.types import KX_GameObject
+from mathutils import Matrix, Vector
+
+from .pool import ObjectPool, INVALID_HANDLE, HANDLE_SLOT_MASK
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Whether the vectorized projectile engine can be used (numpy ships with UPBGE builds)
+PROJECTILES_AVAILABLE = np is not None
+
+DEFAULT_CAPACITY = 256
+
+
+class ProjectileSystem:
+    """ Moves every projectile in one vectorized step per logic tick.
+    Positions, velocities and lifetimes live in NumPy arrays and pooled objects are only
+    used as visual proxies. Hits still cost one rayCast per projectile: the engine has no
+    batched ray query, so the vectorized part is the movement. """
+
+    def __init__(self, caster: KX_GameObject, proxyPool: ObjectPool,
+                 capacity: int = DEFAULT_CAPACITY,
+                 onHit: Callable[[KX_GameObject, Vector, Vector], None] | None = None,
+                 collisionProperty: str = "", mask: int = 0xFFFF) -> None:
+        # Rays are cast through this object's rayCast, which ignores the caster itself
+        self.caster = caster
+        self.proxyPool = proxyPool
+        self.onHit = onHit
+        self.collisionProperty = collisionProperty
+        self.mask = mask
+
+        self.capacity = capacity
+        self.positions = np.zeros((capacity, 3), dtype=np.float64)
+        self.velocities = np.zeros((capacity, 3), dtype=np.float64)
+        self.ages = np.zeros(capacity, dtype=np.float64)
+        self.lifetimes = np.zeros(capacity, dtype=np.float64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.proxyHandles = [INVALID_HANDLE] * capacity
+
+        self.freeIndices: list[int] = list(range(capacity - 1, -1, -1))
+
+    @property
+    def count(self) -> int:
+        return self.capacity - len(self.freeIndices)
+
+    def spawn(self, position: Vector, orientation: Matrix, velocity: Vector, lifetime: float) -> int:
+        """ Fire a projectile, returns its index or -1 when the system is full. """
+        if len(self.freeIndices) < 1:
+            return -1
+
+        index = self.freeIndices.pop()
+
+        handle = self.proxyPool.acquire()
+        proxy = self.proxyPool.objects[handle & HANDLE_SLOT_MASK]
+        # Keep removeBullet from releasing a proxy the system still owns
+        proxy["poolHandle"] = INVALID_HANDLE
+        proxy.worldPosition = position
+        proxy.worldOrientation = orientation
+
+        self.positions[index] = position
+        self.velocities[index] = velocity
+        self.ages[index] = 0.0
+        self.lifetimes[index] = lifetime
+        self.alive[index] = True
+        self.proxyHandles[index] = handle
+
+        return index
+
+    def kill(self, index: int):
+        self.proxyPool.release(self.proxyHandles[index])
+        self.proxyHandles[index] = INVALID_HANDLE
+        self.alive[index] = False
+        self.freeIndices.append(index)
+
+    def clear(self):
+        for index in np.flatnonzero(self.alive).tolist():
+            self.kill(index)
+
+    def update(self, dt: float):
+        """ Advance every projectile by dt seconds. Call once per logic tick. """
+        if self.count == 0:
+            return
+
+        indices = np.flatnonzero(self.alive)
+        starts = self.positions[indices]
+        ends = starts + self.velocities[indices] * dt
+
+        self.ages[indices] += dt
+        expired = self.ages[indices] >= self.lifetimes[indices]
+
+        self.positions[indices] = ends
+
+        caster = self.caster
+        proxyPool = self.proxyPool
+        proxyHandles = self.proxyHandles
+        collisionProperty = self.collisionProperty
+        mask = self.mask
+
+        for index, start, end, isExpired in zip(indices.tolist(), starts.tolist(),
+                                                ends.tolist(), expired.tolist()):
+            proxy = proxyPool.objectFor(proxyHandles[index])
+            if proxy is None:
+                # Proxy was taken back by the pool (e.g. level teardown)
+                self.proxyHandles[index] = INVALID_HANDLE
+                self.alive[index] = False
+                self.freeIndices.append(index)
+                continue
+
+            hitObj, hitPoint, hitNormal = caster.rayCast(
+                end, start, 0, collisionProperty, 0, 0, 0, mask)
+
+            if hitObj is not None:
+                if self.onHit is not None:
+                    self.onHit(hitObj, hitPoint, hitNormal)
+                self.kill(index)
+
+            elif isExpired:
+                self.kill(index)
+
+            else:
+                proxy.worldPosition = end
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import atexit
+import os
+import struct
+import time
+from array import array
+from typing import TYPE_CHECKING
+
+import bge
+import orjson
+
+if TYPE_CHECKING:
+    from .inputs import InputSnapshot
+
+# File layout: MAGIC, uint32 header length, JSON header ({"actions": [...]}),
+# then any number of appended chunks. Each chunk is a uint32 tick count followed by
+# the mouse deltas (2 x float32), held masks (uint32), mouse sensitivity (float32)
+# and pitch direction (uint8) of those ticks, one array after the other.
+MAGIC = b"LD54REC1"
+COUNT_FORMAT = "<I"
+
+# Ticks buffered in memory before they're appended to the file
+FLUSH_TICKS = 300
+
+RECORD_ENV = "LD54_RECORD"
+REPLAY_ENV = "LD54_REPLAY"
+
+
+class InputRecorder:
+    """ Captures the per-tick inputs consumed by ship.movement/ship.shoot into a compact append-only file. """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.header: bytes | None = None
+        self._clear()
+
+        with open(path, "wb"):
+            pass
+        atexit.register(self.close)
+
+    def _clear(self):
+        self.mouseDeltas = array("f")
+        self.held = array("I")
+        self.sensitivity = array("f")
+        self.direction = array("B")
+
+    def record(self, inputs: InputSnapshot, held: int):
+        if self.header is None:
+            # Bit order of the masks, so a replay can remap them onto a different key_map
+            actions = sorted(inputs.actionBits, key=inputs.actionBits.get)
+            header = orjson.dumps({"actions": actions})
+            self.header = MAGIC + struct.pack(COUNT_FORMAT, len(header)) + header
+            with open(self.path, "ab") as outfile:
+                outfile.write(self.header)
+
+        self.mouseDeltas.extend(inputs.mouseDelta)
+        self.held.append(held)
+        self.sensitivity.append(inputs.setting("MOUSE_SENSITIVITY"))
+        self.direction.append(bool(inputs.setting("DIRECTION")))
+
+        if len(self.held) >= FLUSH_TICKS:
+            self.flush()
+
+    def flush(self):
+        if len(self.held) < 1:
+            return
+
+        with open(self.path, "ab") as outfile:
+            outfile.write(struct.pack(COUNT_FORMAT, len(self.held)))
+            outfile.write(self.mouseDeltas.tobytes())
+            outfile.write(self.held.tobytes())
+            outfile.write(self.sensitivity.tobytes())
+            outfile.write(self.direction.tobytes())
+
+        self._clear()
+
+    def close(self):
+        self.flush()
+
+
+class InputPlayer:
+    """ Feeds a recording back through InputSnapshot and collects frame time and pool allocation numbers. """
+
+    def __init__(self, path: str, reportPath: str | None = None) -> None:
+        self.path = path
+        self.reportPath = reportPath or f"{path}.report.json"
+
+        self.mouseDeltas = array("f")
+        self.held = array("I")
+        self.sensitivity = array("f")
+        self.direction = array("B")
+        self.actions: list[str] = []
+        self._load()
+
+        self.tick = 0
+        self.bitMap: list[int] = []
+        self.frameTimes = array("d")
+        self.allocations = array("I")
+        self.lastTime: float | None = None
+        self.finished = False
+
+    def _load(self):
+        with open(self.path, "rb") as infile:
+            data = infile.read()
+
+        if not data.startswith(MAGIC):
+            raise ValueError(f"{self.path} is not an input recording")
+
+        offset = len(MAGIC)
+        headerLength, = struct.unpack_from(COUNT_FORMAT, data, offset)
+        offset += struct.calcsize(COUNT_FORMAT)
+        self.actions = orjson.loads(data[offset:offset + headerLength])["actions"]
+        offset += headerLength
+
+        while offset < len(data):
+            count, = struct.unpack_from(COUNT_FORMAT, data, offset)
+            offset += struct.calcsize(COUNT_FORMAT)
+
+            for target, itemCount in ((self.mouseDeltas, count * 2), (self.held, count),
+                                      (self.sensitivity, count), (self.direction, count)):
+                size = itemCount * target.itemsize
+                target.frombytes(data[offset:offset + size])
+                offset += size
+
+    @property
+    def tickCount(self) -> int:
+        return len(self.held)
+
+    def _remapHeld(self, recorded: int, inputs: InputSnapshot) -> int:
+        if len(self.bitMap) != len(self.actions):
+            self.bitMap = [inputs.actionBits.get(action, 0) for action in self.actions]
+
+        held = 0
+        for index, bit in enumerate(self.bitMap):
+            if recorded & (1 << index):
+                held |= bit
+        return held
+
+    def _measure(self):
+        now = time.perf_counter()
+        if self.lastTime is not None:
+            self.frameTimes.append(now - self.lastTime)
+        self.lastTime = now
+
+        poolManager = getattr(bge.logic, "poolManager", None)
+        if poolManager is not None:
+            self.allocations.append(
+                sum(pool.stats.allocations for pool in poolManager.pools.values()))
+
+    def nextTick(self, inputs: InputSnapshot) -> int:
+        """ Apply the next recorded tick to inputs, returns its held mask. The recorded settings
+        go in as overrides, the player's saved config is never touched. """
+        if self.tick >= self.tickCount:
+            self.finish()
+            return 0
+
+        self._measure()
+
+        tick = self.tick
+        self.tick += 1
+
+        inputs.mouseDelta = (self.mouseDeltas[tick * 2], self.mouseDeltas[tick * 2 + 1])
+
+        inputs.configOverrides["MOUSE_SENSITIVITY"] = self.sensitivity[tick]
+        inputs.configOverrides["DIRECTION"] = bool(self.direction[tick])
+
+        return self._remapHeld(self.held[tick], inputs)
+
+    def report(self) -> dict:
+        frameTimes = sorted(self.frameTimes)
+        count = len(frameTimes)
+        report = {"recording": os.path.basename(self.path), "ticks": self.tick}
+
+        if count > 0:
+            report["frameTimeMs"] = {
+                "mean": sum(frameTimes) / count * 1000.0,
+                "median": frameTimes[count // 2] * 1000.0,
+                "p99": frameTimes[min(count - 1, int(count * 0.99))] * 1000.0,
+                "max": frameTimes[-1] * 1000.0,
+            }
+
+        if len(self.allocations) > 0:
+            report["poolAllocations"] = self.allocations[-1] - self.allocations[0]
+
+        return report
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+
+        with open(self.reportPath, "wb") as outfile:
+            outfile.write(orjson.dumps(self.report(), option=orjson.OPT_INDENT_2))
+        bge.logic.endGame()
+
+
+def setupFromEnvironment(inputs: InputSnapshot):
+    """ Start recording to $LD54_RECORD or replaying $LD54_REPLAY, if either is set. """
+    if REPLAY_ENV in os.environ:
+        inputs.player = InputPlayer(os.environ[REPLAY_ENV])
+    elif RECORD_ENV in os.environ:
+        inputs.recorder = InputRecorder(os.environ[RECORD_ENV])
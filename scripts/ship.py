@@ -1,9 +1,14 @@
 import bge
-from bge.types import SCA_PythonController
-import aud
+from bge.types import KX_GameObject, SCA_PythonController
+from mathutils import Matrix
 from threading import Thread
 
-from .pool import ObjectPool
+from .audio import getAudioManager
+from .camera import updateRig
+from .handles import getObject
+from .inputs import getInputs
+from .pool import ObjectPool, PoolManager
+from .projectiles import ProjectileSystem, PROJECTILES_AVAILABLE
 
 ROTATE_FAC = 0.1
 ORIENT_MOVE_FACTOR = 90.0
@@ -13,89 +18,156 @@ THROTTLE_FAC = 2.2
 MAX_ROT_VELO = 6.2
 MAX_MOVEMENT_SPEED = 200.0  # 40.0
 SLOW_DOWN_SPEED = 2.0
+LASER_POOL_SIZE = 20
+LASER_WARM_COUNT = 10
+LASER_SPEED = 200.0
+LASER_LIFETIME = 1.0
+# Property of targets that react to vector lasers, called with the hit point and normal
+LASER_HIT_HOOK = "onLaserHit"
+
+# The per-tick flight constants above were tuned at 60 logic ticks per second.
+# movement() advances them in fixed steps of this length whatever the logic rate is.
+FIXED_STEP = 1.0 / 60.0
+MAX_SUBSTEPS = 5
 
 mouse = bge.logic.mouse
 keyboard = bge.logic.keyboard
 
 
-def playSound(path, scene, obj=None, max_distance=10):
-    """ Play 3D sound from path in the position of given object.
-    Remember that 3D sound only works with mono audio files. """
+class FixedStepClock:
+    """ Accumulates logic tick time and hands it out in whole fixed steps.
+    alpha is the leftover fraction of a step, for interpolating what gets rendered. """
+
+    def __init__(self, step: float = FIXED_STEP, maxSubsteps: int = MAX_SUBSTEPS) -> None:
+        self.step = step
+        self.maxSubsteps = maxSubsteps
+        self.accumulator = 0.0
+
+    def advance(self, dt: float) -> int:
+        self.accumulator += dt
+        steps = int(self.accumulator / self.step)
+
+        if steps > self.maxSubsteps:
+            # Too far behind (e.g. after a hitch), drop the extra time instead of spiraling
+            steps = self.maxSubsteps
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= steps * self.step
 
-    # Get the audio device and set its properties according to current camera
-    if "sound_device" not in bge.logic.globalDict:
-        bge.logic.globalDict["sound_device"] = aud.device()
+        return steps
 
-    device = bge.logic.globalDict["sound_device"]
+    @property
+    def alpha(self) -> float:
+        return self.accumulator / self.step
 
-    # Create an audio factory and play it, with a handle as result
 
-    if "sound_lib" not in bge.logic.globalDict:
-        bge.logic.globalDict["sound_lib"] = {}
+class PoseInterpolator:
+    """ The ship's pose at the last two fixed steps. The visual model is drawn between them
+    by the clock's alpha, so it moves smoothly when ticks and fixed steps don't line up.
+    The camera follows the drawn pose too (see camera.updateRig), not the physics body. """
 
-    soundLib = bge.logic.globalDict["sound_lib"]
+    def __init__(self, obj: KX_GameObject, model: KX_GameObject) -> None:
+        # Where the model sits relative to the ship, as authored
+        self.modelOffset = model.localTransform.copy()
+        self.previous = self._capture(obj)
+        self.current = self.previous
+        # Pose the model was last drawn at
+        self.drawn = self.current
 
-    if path not in soundLib:
-        sound = aud.Factory(path)
-        sound.buffer()
-        soundLib[path] = sound
+    @staticmethod
+    def _capture(obj: KX_GameObject) -> tuple:
+        return obj.worldPosition.copy(), obj.worldOrientation.to_quaternion()
 
-    bufferedSound = soundLib[path]
-    handle = device.play(bufferedSound)
+    def step(self, obj: KX_GameObject):
+        self.previous = self.current
+        self.current = self._capture(obj)
 
-    if obj is not None:
-        device.distance_model = aud.AUD_DISTANCE_MODEL_LINEAR
-        device.listener_location = scene.active_camera.worldPosition
-        device.listener_orientation = scene.active_camera.worldOrientation.to_quaternion()
+    def snap(self, obj: KX_GameObject):
+        """ After a teleport (respawn), so the model doesn't sweep across the level. """
+        self.previous = self._capture(obj)
+        self.current = self.previous
+        self.drawn = self.current
 
-        # Makes the handle behave as a 3D sound
-        handle.relative = False
-        handle.location = obj.worldPosition
+    def apply(self, obj: KX_GameObject, model: KX_GameObject, alpha: float):
+        previousPos, previousRot = self.previous
+        currentPos, currentRot = self.current
 
-        # If sound source is farther from listener than the value below, volume is zero
-        handle.distance_maximum = max_distance
+        position = previousPos.lerp(currentPos, alpha)
+        orientation = previousRot.slerp(currentRot, alpha)
+        self.drawn = position, orientation
+
+        scale = Matrix.Diagonal(obj.worldScale.to_4d())
+        model.worldTransform = Matrix.Translation(position) \
+            @ orientation.to_matrix().to_4x4() @ scale @ self.modelOffset
+
+
+def playSound(path, scene, obj=None, max_distance=10):
+    """ Play 3D sound from path in the position of given object.
+    Remember that 3D sound only works with mono audio files. """
+
+    # The manager keeps the device, buffers and voice limits, and updates the listener per frame
+    audioManager = getAudioManager()
+    audioManager.attachListener(scene)
+
+    return audioManager.play(path, obj, max_distance)
 
 
 def movement(cont: SCA_PythonController):
     if cont.sensors["loop"].positive:
 
         own = cont.owner
-        target = own.scene.objects["lookTarget"]
+        target = getObject(own.scene, "lookTarget")
         model = own.children["model"]
 
+        if "flightClock" not in own:
+            own["flightClock"] = FixedStepClock()
+            own["flightPose"] = PoseInterpolator(own, model)
+            own["prevThrottle"] = own["throttle"]
+
+        clock: FixedStepClock = own["flightClock"]
+        pose: PoseInterpolator = own["flightPose"]
+
+        # Logic runs at a fixed tick rate, so one call always covers exactly this much time
+        dt = 1.0 / bge.logic.getLogicTicRate()
+        steps = clock.advance(dt)
+        # Scales per-tick rates measured at 60Hz to this tick's length
+        tickScale = FIXED_STEP / dt
+
         tarVec = own.getVectTo(target)[1]
-        own.lookAt(tarVec, 1, ROTATE_FAC)
+        # Same convergence per second as ROTATE_FAC applied once per 60Hz tick
+        own.lookAt(tarVec, 1, 1.0 - (1.0 - ROTATE_FAC) ** (dt / FIXED_STEP))
 
-        keyMap = bge.logic.globalDict["key_map"]
-        config = bge.logic.globalDict["config"]
+        inputs = getInputs()
 
-        mouseDelta = mouse.deltaPosition
+        # Mouse delta is the distance moved since the last tick, turn it into a rate
+        mouseDelta = inputs.mouseDelta
+        mouseFactor = ORIENT_MOVE_FACTOR * inputs.setting("MOUSE_SENSITIVITY") * tickScale
         # ship.applyRotation([0, 0, mouseDelta[0]], True)
         # zVec = Vector([0, 0, mouseDelta[0]])
         # ship.applyTorque(zVec, True)
         # ship.applyRotation([mouseDelta[1], 0, 0], True)
         own.localAngularVelocity.z = max(
-            min(mouseDelta[0] * ORIENT_MOVE_FACTOR * config["MOUSE_SENSITIVITY"], MAX_ROT_VELO), -MAX_ROT_VELO)
+            min(mouseDelta[0] * mouseFactor, MAX_ROT_VELO), -MAX_ROT_VELO)
 
-        if config["DIRECTION"]:
+        if inputs.setting("DIRECTION"):
             xMouse = -mouseDelta[1]
         else:
             xMouse = mouseDelta[1]
 
         own.localAngularVelocity.x = max(
-            min(xMouse * ORIENT_MOVE_FACTOR * config["MOUSE_SENSITIVITY"], MAX_ROT_VELO), -MAX_ROT_VELO)
+            min(xMouse * mouseFactor, MAX_ROT_VELO), -MAX_ROT_VELO)
 
         mouse.reCenter()
 
         right = False
         left = False
 
-        activeInputs = {**keyboard.activeInputs, **mouse.activeInputs}
-        if keyMap["roll_left"] in activeInputs:
-            own.localAngularVelocity.y -= ROLL_FACTOR
+        held = inputs.held
+        if held & inputs.bit("roll_left"):
+            own.localAngularVelocity.y -= ROLL_FACTOR * steps
             left = True
-        if keyMap["roll_right"] in activeInputs:
-            own.localAngularVelocity.y += ROLL_FACTOR
+        if held & inputs.bit("roll_right"):
+            own.localAngularVelocity.y += ROLL_FACTOR * steps
             right = True
 
         if (right and left) or (not (right or left)):
@@ -104,15 +176,20 @@ def movement(cont: SCA_PythonController):
         own.localAngularVelocity.y = max(
             min(own.localAngularVelocity.y, MAX_ROT_VELO), -MAX_ROT_VELO)
 
-        if keyMap["throttle_up"] in activeInputs:
-            own["throttle"] += THROTTLE_RAMP
-        if keyMap["throttle_down"] in activeInputs:
-            own["throttle"] -= THROTTLE_RAMP
+        if steps > 0:
+            pose.step(own)
+            own["prevThrottle"] = own["throttle"]
+
+            if held & inputs.bit("throttle_up"):
+                own["throttle"] += THROTTLE_RAMP * steps
+            if held & inputs.bit("throttle_down"):
+                own["throttle"] -= THROTTLE_RAMP * steps
 
-        own["throttle"] = min(100, max(0, own["throttle"]))
+            own["throttle"] = min(100, max(0, own["throttle"]))
 
         nose = cont.sensors["nose"]
 
+        # Forces are rates, the physics step integrates them with its own timestep
         if not nose.positive:
             own.applyForce([0, own["throttle"] * THROTTLE_FAC, 0], True)
 
@@ -125,7 +202,25 @@ def movement(cont: SCA_PythonController):
 
         own.localLinearVelocity.x = 0
         own.localLinearVelocity.z = 0
-        model["frame"] = own["throttle"]
+
+        # Interpolate the model's pose and throttle animation between fixed steps
+        alpha = clock.alpha
+        pose.apply(own, model, alpha)
+        # Then move the camera to the pose just drawn, in the same tick
+        rig = own.get("cameraRig")
+        if rig is not None and not rig.invalid:
+            updateRig(rig)
+        prevThrottle = own["prevThrottle"]
+        model["frame"] = prevThrottle + \
+            (own["throttle"] - prevThrottle) * alpha
+
+
+def laserHit(hitObj, hitPoint, hitNormal):
+    """ onHit for vector lasers. They have no physics to set off collision sensors, so
+    targets that react to them register a LASER_HIT_HOOK callable. Others just stop the laser. """
+    hook = hitObj.get(LASER_HIT_HOOK)
+    if hook is not None:
+        hook(hitPoint, hitNormal)
 
 
 def shoot(cont: SCA_PythonController):
@@ -133,36 +228,58 @@ def shoot(cont: SCA_PythonController):
         own = cont.owner
 
         if "init" not in own:
-            own["pool"] = ObjectPool(
-                own.scene, own, "GoodLaser", 20, -200, usePhysics=True)
+            # Shared per scene, so warmed lasers outlive this emitter and level reloads
+            poolManager: PoolManager = getattr(bge.logic, "poolManager", None)
+            if poolManager is None:
+                return
+
+            config = bge.logic.globalDict["config"]
+            if config.get("VECTOR_PROJECTILES", False) and PROJECTILES_AVAILABLE:
+                # Lasers are moved by the projectile system, pooled objects are only visuals
+                proxyPool = poolManager.getPool(
+                    "GoodLaser", own, LASER_POOL_SIZE, -200, warmCount=LASER_WARM_COUNT,
+                    key="GoodLaserProxy", ghost=True)
+                own["projectiles"] = ProjectileSystem(own, proxyPool, onHit=laserHit)
+            else:
+                own["pool"] = poolManager.getPool(
+                    "GoodLaser", own, LASER_POOL_SIZE, -200, usePhysics=True,
+                    warmCount=LASER_WARM_COUNT)
             own["init"] = True
 
-        pool: ObjectPool = own["pool"]
+        projectiles: ProjectileSystem | None = own.get("projectiles")
+        if projectiles is not None:
+            projectiles.update(1.0 / bge.logic.getLogicTicRate())
 
-        keyMap = bge.logic.globalDict["key_map"]
-        activeInputs = {**keyboard.activeInputs, **mouse.activeInputs}
+        inputs = getInputs()
 
-        if (keyMap["shoot"] in activeInputs) and (own["cool"] > 0.1):
+        if inputs.isHeld("shoot") and (own["cool"] > 0.1):
             own["cool"] = 0.0
-            obj = pool.getObject()
-            obj.localLinearVelocity.x = 0
-            obj.localLinearVelocity.y = 0
-            obj.setAngularVelocity([0, 0, 0], True)
-            obj.worldPosition = own.worldPosition
-            obj.worldOrientation = own.worldOrientation
-            obj.localLinearVelocity.y = 200
+
+            if projectiles is not None:
+                projectiles.spawn(own.worldPosition, own.worldOrientation,
+                                  own.worldOrientation.col[1] * LASER_SPEED, LASER_LIFETIME)
+            else:
+                pool: ObjectPool = own["pool"]
+                obj = pool.getObject()
+                obj.localLinearVelocity.x = 0
+                obj.localLinearVelocity.y = 0
+                obj.setAngularVelocity([0, 0, 0], True)
+                obj.worldPosition = own.worldPosition
+                obj.worldOrientation = own.worldOrientation
+                obj.localLinearVelocity.y = LASER_SPEED
+
             path_to_shoot = bge.logic.expandPath(
                 "//assets/sound/Spaceship_Shoot.mp3")
-            # playSound(path_to_shoot, own.scene)
+            playSound(path_to_shoot, own.scene)
 
 
 def removeBullet(cont: SCA_PythonController):
     if cont.sensors["Delay"].positive or cont.sensors["Collision"].positive:
         own = cont.owner
 
+        # Stale handles (already released this tick) are ignored by the pool
         pool: ObjectPool = own["pool"]
-        if own["poolID"] in pool.activeObjects:
-            pool.removeObject(own)
+        pool.release(own["poolHandle"])
 
 
 def hurt(cont: SCA_PythonController):
@@ -172,8 +289,7 @@ def hurt(cont: SCA_PythonController):
         if cont.sensors["lava"].positive:
             own["health"] -= 6
 
-        overlay = bge.logic.getSceneList()["overlay"]
-        plane = overlay.objects["HurtPlane"]
+        plane = getObject("overlay", "HurtPlane")
         plane["hurt"] = True
 
         if own["health"] <= 0:
@@ -1,17 +1,109 @@
+import bge
 from bge.types import KX_GameObject, SCA_PythonController
 
+from .levels import HIDDEN_STATE
+
+# Switches a level needs when its controller has no "switchesNeeded" property
+DEFAULT_SWITCHES_NEEDED = 10
+
+
+def switchBricks(switch: KX_GameObject) -> tuple:
+    """ The property the switch's collision sensor filters on and its Replace Mesh actuator
+    (or None), from the controller that flips it in the blend. """
+    for controller in switch.controllers:
+        hitProperty = None
+        for sensor in controller.sensors:
+            # Collision sensor, whatever the engine version calls its class
+            if hasattr(sensor, "usePulseCollision"):
+                hitProperty = sensor.propName
+        if hitProperty is None:
+            continue
+
+        for actuator in controller.actuators:
+            if hasattr(actuator, "instantReplaceMesh"):
+                return hitProperty, actuator
+        return hitProperty, None
+
+    return None, None
+
+
+class SwitchListener:
+    """ Flips a switch and publishes it to the counter. This is the only place "switched" is
+    written: the switch's own bricks are parked in HIDDEN_STATE, their hit property and mesh
+    are read from them. Physics lasers reach it as a collision callback, vector lasers
+    through the switch's "onLaserHit" hook. """
+
+    def __init__(self, counter: "SwitchCounter", switch: KX_GameObject) -> None:
+        self.counter = counter
+        self.switch = switch
+        self.hitProperty, self.meshActuator = switchBricks(switch)
+
+    def __call__(self, other: KX_GameObject, *args):
+        if self.hitProperty is not None and self.hitProperty in other:
+            self.flip()
+
+    def flip(self, *args):
+        switch = self.switch
+        if switch["switched"]:
+            return
+
+        switch["switched"] = True
+        actuator = self.meshActuator
+        if actuator is not None and actuator.mesh is not None:
+            switch.replaceMesh(actuator.mesh, actuator.useDisplayMesh, actuator.usePhysicsMesh)
+
+        self.counter.publish(switch, True)
+
+
+class SwitchCounter:
+    """ Number of switched children of a level controller, kept up to date by the switches
+    publishing their changes instead of a scan over every child each tick. """
+
+    def __init__(self, owner: KX_GameObject, threshold: int) -> None:
+        self.threshold = threshold
+        self.states: dict[KX_GameObject, bool] = {}
+        self.count = 0
+
+        for obj in owner.children:
+            if "switched" in obj:
+                self.watch(obj)
+
+    def watch(self, switch: KX_GameObject):
+        callbacks = switch.collisionCallbacks
+        callbacks[:] = [callback for callback in callbacks
+                        if not isinstance(callback, SwitchListener)]
+        listener = SwitchListener(self, switch)
+        callbacks.append(listener)
+        switch["onLaserHit"] = listener.flip
+        switch.state = HIDDEN_STATE
+
+        self.states[switch] = False
+        self.publish(switch, bool(switch["switched"]))
+
+    def publish(self, switch: KX_GameObject, state: bool):
+        if self.states.get(switch) == state:
+            return
+
+        self.states[switch] = state
+        self.count += 1 if state else -1
+
+    @property
+    def complete(self) -> bool:
+        return self.count >= self.threshold
+
 
 def runLevelThingy(cont: SCA_PythonController):
     if cont.sensors["loop"].positive:
         own = cont.owner
-        count = 0
-        for obj in own.children:
-            if "switched" in obj:
-                if obj["switched"]:
-                    count += 1
 
-        if count >= 10:
+        if "switchCounter" not in own:
+            own["switchCounter"] = SwitchCounter(
+                own, own.get("switchesNeeded", DEFAULT_SWITCHES_NEEDED))
+
+        counter: SwitchCounter = own["switchCounter"]
+        if counter.complete:
             obj = own.scene.addObject(
                 own.scene.objectsInactive["NextLevelThing"], own, 0.0)
             obj.worldPosition = own.worldPosition
+            bge.logic.levelManager.track(obj)
             own.endObject()
@@ -1,11 +1,18 @@
 from __future__ import annotations
 
+from array import array
 from enum import Enum
 from typing import TYPE_CHECKING
 import sys
 
 from .bgimgui import widgets
+from .bgimgui.atlas import ui_atlas
+from .bgimgui.loader import image_loader
+from .camera import CameraCollider
+from .handles import registry, getObject, getScene, replaceScene
+from .inputs import getInputs
 from .levels import LevelManager
+from .pool import ObjectPool, PoolManager
 
 import imgui
 import bge
@@ -91,7 +98,7 @@ class SettingsWindow(widgets.GUIWindow):
         _, self.maxLogicFrame = imgui.input_int(
             "##maxLogicFrames", self.maxLogicFrame)
 
-        imgui.text("Logic Tick Rate (FPS) [BUGGY, use 60fps]")
+        imgui.text("Logic Tick Rate (FPS)")
         _, self.logicTickRate = imgui.input_float(
             "##logicTickRate", self.logicTickRate)
 
@@ -128,8 +135,8 @@ class SettingsWindow(widgets.GUIWindow):
             self.controlCaptureMode = False
             return
 
-        # Put all active inputs in one dictionary
-        allInputs = {**keyboard.activeInputs, **mouse.activeInputs}
+        # All active keyboard and mouse inputs, merged once per tick
+        allInputs = getInputs().activeInputs
         keyMap = bge.logic.globalDict["key_map"]
 
         imgui.text("Enter a key or mouse button...")
@@ -138,6 +145,7 @@ class SettingsWindow(widgets.GUIWindow):
             activeInput = list(allInputs)[0]
             if (activeInput != bge.events.MOUSEX) and (activeInput != bge.events.MOUSEY):
                 keyMap[self.controlValue] = activeInput
+                getInputs().keyMapChanged()
                 self.controlCaptureMode = False
 
     def drawControlSettings(self):
@@ -156,9 +164,11 @@ class SettingsWindow(widgets.GUIWindow):
                 if ("MOUSEX" in stringName):
                     if imgui.button(f"\uea7c ##{key}"):
                         keyMap[key] = bge.events.MOUSEY
+                        getInputs().keyMapChanged()
                 elif ("MOUSEY" in stringName):
                     if imgui.button(f"\uea7c ##{key}"):
                         keyMap[key] = bge.events.MOUSEX
+                        getInputs().keyMapChanged()
 
             imgui.same_line()
 
@@ -242,10 +252,11 @@ class StartPanel(widgets.GUIWindow):
     def drawContents(self):
 
         if imgui.button("Start", -1):
-            scene = bge.logic.getSceneList()["title"]
-            scene.replace("game")
+            scene = getScene("title")
+            replaceScene(scene, "game")
             self.gui.updateSceneName("game")
             self.gui.mode = GUIModes.MAIN_GAME
+            self.gui.playModeMusic()
             self.gui.showCursor = False
 
         if imgui.button("Help", -1):
@@ -322,8 +333,7 @@ class HealthBar(widgets.GUIWindow):
         super().drawWindow()
 
     def drawContents(self):
-        mainScene = bge.logic.getSceneList()["game"]
-        ship = mainScene.objects["ship"]
+        ship = getObject("game", "ship")
         imgui.push_style_color(imgui.COLOR_PLOT_HISTOGRAM, 1.0, 0.0, 0.3529)
         imgui.progress_bar(ship["health"] / 100.0, (200, 20), "Health")
         imgui.pop_style_color(1)
@@ -354,6 +364,162 @@ class TimerWindow(widgets.GUIWindow):
         super().drawWindow()
 
     def drawContents(self):
-        mainScene = bge.logic.getSceneList()["game"]
-        time = mainScene.objects["Timer"]["time"]
-        imgui.text(f"{time}s")
+        time = getObject("game", "Timer")["time"]
+        # Tenths only: the text (and the retained UI frame) changes 10 times a second, not every frame
+        imgui.text(f"{time:.1f}s")
+
+
+class PoolStatsWindow(widgets.GUIWindow):
+    def __init__(self, io: imgui._IO, gui: MainGameGUI, flags=0) -> None:
+        flags |= imgui.WINDOW_ALWAYS_AUTO_RESIZE
+        super().__init__("Pool Stats", io, True, flags)
+        self.setVisible(SettingsWindow.START_DEBUG)
+        self.gui = gui
+
+    def drawWindow(self):
+        if self.gui.settingsWindow.showDebug:
+            super().drawWindow()
+
+    def drawContents(self):
+        poolManager: PoolManager = getattr(bge.logic, "poolManager", None)
+        if poolManager is None:
+            imgui.text("No level loaded")
+            return
+
+        imgui.text(
+            f"Pooled objects: {poolManager.objectCount} / {poolManager.objectBudget}")
+        imgui.separator()
+
+        for key, pool in poolManager.pools.items():
+            self.drawPool(key, pool)
+
+    def drawPool(self, key: str, pool: ObjectPool):
+        stats = pool.stats
+        imgui.text(f"{key} (maxSize {pool.maxSize})")
+        imgui.separator()
+        imgui.text(
+            f"Active: {pool.activeCount}  Free: {len(pool.freeSlots)}  High water: {stats.highWaterMark}")
+        imgui.text(
+            f"Hit rate: {stats.hitRate * 100.0:.1f}%  Hits: {stats.hits}  Misses: {stats.misses}")
+        imgui.text(
+            f"Allocations: {stats.allocations}  Overflow discards: {stats.overflowDiscards}  Invalid skipped: {stats.invalidSkipped}")
+        imgui.text(f"Physics suspend/restore: {stats.physicsTime * 1000.0:.2f} ms")
+
+        imgui.plot_lines(f"Active##{key}",
+                         array("f", stats.history["active"]), graph_size=(300, 40))
+        imgui.plot_histogram(f"Allocations##{key}",
+                             array("f", stats.history["allocations"]), graph_size=(300, 40))
+        imgui.spacing()
+
+
+class HandleStatsWindow(widgets.GUIWindow):
+    def __init__(self, io: imgui._IO, gui: MainGameGUI, flags=0) -> None:
+        flags |= imgui.WINDOW_ALWAYS_AUTO_RESIZE
+        super().__init__("Handle Registry", io, True, flags)
+        self.setVisible(SettingsWindow.START_DEBUG)
+        self.gui = gui
+
+    def drawWindow(self):
+        if self.gui.settingsWindow.showDebug:
+            super().drawWindow()
+
+    def drawContents(self):
+        imgui.text(f"Hits: {registry.hits}  Misses: {registry.misses}")
+        imgui.separator()
+
+        # Lookups that keep missing after a level has loaded are the ones left to fix
+        for (sceneName, objName), count in sorted(
+                registry.missCounts.items(), key=lambda item: -item[1]):
+            imgui.text(f"{sceneName}/{objName}: {count}")
+
+
+class CameraStatsWindow(widgets.GUIWindow):
+    def __init__(self, io: imgui._IO, gui: MainGameGUI, flags=0) -> None:
+        flags |= imgui.WINDOW_ALWAYS_AUTO_RESIZE
+        super().__init__("Camera", io, True, flags)
+        self.setVisible(SettingsWindow.START_DEBUG)
+        self.gui = gui
+
+    def drawWindow(self):
+        if self.gui.settingsWindow.showDebug:
+            super().drawWindow()
+
+    def drawContents(self):
+        collider: CameraCollider = getattr(bge.logic, "cameraCollider", None)
+        if collider is None:
+            imgui.text("No camera yet")
+            return
+
+        imgui.text(f"Raycasts: {collider.raysPerSecond:.1f}/s  Old: {collider.oldRaysPerSecond:.1f}/s")
+        imgui.text(f"Saved: {collider.savedPerSecond:+.1f}/s")
+        imgui.text(f"Free fraction: {collider.fraction:.2f}")
+
+
+class LevelStatsWindow(widgets.GUIWindow):
+    def __init__(self, io: imgui._IO, gui: MainGameGUI, flags=0) -> None:
+        flags |= imgui.WINDOW_ALWAYS_AUTO_RESIZE
+        super().__init__("Level", io, True, flags)
+        self.setVisible(SettingsWindow.START_DEBUG)
+        self.gui = gui
+
+    def drawWindow(self):
+        if self.gui.settingsWindow.showDebug:
+            super().drawWindow()
+
+    def drawContents(self):
+        levelManager: LevelManager = getattr(bge.logic, "levelManager", None)
+        if levelManager is None:
+            imgui.text("No level loaded")
+            return
+
+        imgui.text(f"Level {levelManager.currentLevel}")
+        imgui.text(
+            f"Spawned: {len(levelManager.levelObjects)}  Tracked: {len(levelManager.owned)}")
+        imgui.text(
+            f"Last teardown: {levelManager.lastTeardownCount} objects in {levelManager.lastTeardownMs:.2f} ms")
+        imgui.text(f"Last respawn restored: {levelManager.lastRestoreCount} entities")
+
+
+class RendererStatsWindow(widgets.GUIWindow):
+    def __init__(self, io: imgui._IO, gui: MainGameGUI, flags=0) -> None:
+        flags |= imgui.WINDOW_ALWAYS_AUTO_RESIZE
+        super().__init__("Renderer", io, True, flags)
+        self.setVisible(SettingsWindow.START_DEBUG)
+        self.gui = gui
+
+    def drawWindow(self):
+        if self.gui.settingsWindow.showDebug:
+            super().drawWindow()
+
+    def drawContents(self):
+        backend = self.gui.imgui_backend
+        imgui.text(type(backend).__name__)
+
+        stats = backend.drawStats
+        imgui.text(
+            f"Draw calls: {stats.frame_draws} for {stats.frame_commands} commands  Saved: {stats.saved * 100.0:.1f}%")
+
+        imgui.text(
+            f"UI atlas: {len(ui_atlas.pages)} pages, {ui_atlas.image_count} images, "
+            f"{ui_atlas.fill * 100.0:.1f}% filled, {ui_atlas.repacks} repacks")
+
+        imgui.text(
+            f"Images queued: {image_loader.queue_depth}  Waiting upload: {image_loader.waiting_upload}  "
+            f"Uploads last frame: {image_loader.last_drain_uploads} ({image_loader.last_drain_ms:.2f} ms)")
+        imgui.text(
+            f"Decode: mean {image_loader.decode_ms_mean:.1f} ms, max {image_loader.decode_ms_max:.1f} ms  "
+            f"Request to upload: mean {image_loader.latency_ms_mean:.1f} ms, max {image_loader.latency_ms_max:.1f} ms")
+
+        state = backend.glState
+        imgui.text(
+            f"GL state calls: {state.calls}  Skipped: {state.skipped}  Queries: {state.queries}")
+        if len(state.mismatches) > 0:
+            imgui.text(f"GL state mismatches: {len(state.mismatches)}, last {state.mismatches[-1][0]}")
+
+        retained = backend.retained
+        if retained is None:
+            imgui.text("Retained output off")
+            return
+
+        imgui.text(
+            f"Retained hit rate: {retained.hit_rate * 100.0:.1f}%  Hits: {retained.hits}  Misses: {retained.misses}")
@@ -0,0 +1,429 @@
+""" Drives the bge-free parts of bgimgui (glstate, batch, stream, atlas, loader), in a
+headless Mesa context where GL is needed. Run with: python -m pytest tests """
+import ctypes
+import importlib
+import os
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+
+imgui = pytest.importorskip("imgui")
+EGL = pytest.importorskip("OpenGL.EGL")
+gl = pytest.importorskip("OpenGL.GL")
+
+BGIMGUI_DIR = Path(__file__).resolve().parents[1] / "scripts" / "bgimgui"
+WIDTH = 128
+HEIGHT = 96
+
+VERTEX_SHADER_SRC = """
+#version 330
+
+uniform mat4 ProjMtx;
+in vec2 Position;
+in vec2 UV;
+in vec4 Color;
+out vec2 Frag_UV;
+out vec4 Frag_Color;
+
+void main() {
+    Frag_UV = UV;
+    Frag_Color = Color;
+    gl_Position = ProjMtx * vec4(Position.xy, 0, 1);
+}
+"""
+
+FRAGMENT_SHADER_SRC = """
+#version 330
+
+uniform sampler2D Texture;
+in vec2 Frag_UV;
+in vec4 Frag_Color;
+out vec4 Out_Color;
+
+void main() {
+    Out_Color = Frag_Color * texture(Texture, Frag_UV.st);
+}
+"""
+
+
+def load(name: str):
+    """ Import bgimgui.<name> without running the package's __init__, which needs bge. """
+    if "bgimgui" not in sys.modules:
+        package = types.ModuleType("bgimgui")
+        package.__path__ = [str(BGIMGUI_DIR)]
+        sys.modules["bgimgui"] = package
+    return importlib.import_module(f"bgimgui.{name}")
+
+
+def _attribs(*values):
+    return (EGL.EGLint * (len(values) + 1))(*values, EGL.EGL_NONE)
+
+
+@pytest.fixture(scope="module")
+def context():
+    """ Surfaceless EGL pbuffer context, Mesa's llvmpipe when no GPU is around. """
+    display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+    major, minor = EGL.EGLint(), EGL.EGLint()
+    if display == EGL.EGL_NO_DISPLAY or not EGL.eglInitialize(
+            display, ctypes.pointer(major), ctypes.pointer(minor)):
+        pytest.skip("no EGL display")
+
+    config = EGL.EGLConfig()
+    count = EGL.EGLint()
+    EGL.eglChooseConfig(display, _attribs(
+        EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT, EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+        EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8, EGL.EGL_BLUE_SIZE, 8, EGL.EGL_ALPHA_SIZE, 8),
+        ctypes.pointer(config), 1, ctypes.pointer(count))
+    if count.value < 1:
+        pytest.skip("no EGL config with a pbuffer")
+
+    EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+    egl_context = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT, _attribs(
+        EGL.EGL_CONTEXT_MAJOR_VERSION, 3, EGL.EGL_CONTEXT_MINOR_VERSION, 3,
+        EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK, EGL.EGL_CONTEXT_OPENGL_COMPATIBILITY_PROFILE_BIT))
+    surface = EGL.eglCreatePbufferSurface(display, config, _attribs(
+        EGL.EGL_WIDTH, WIDTH, EGL.EGL_HEIGHT, HEIGHT))
+    if egl_context == EGL.EGL_NO_CONTEXT or not EGL.eglMakeCurrent(
+            display, surface, surface, egl_context):
+        pytest.skip("no GL 3.3 context")
+
+    yield display
+
+    EGL.eglMakeCurrent(display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+    EGL.eglDestroySurface(display, surface)
+    EGL.eglDestroyContext(display, egl_context)
+    EGL.eglTerminate(display)
+
+
+@pytest.fixture
+def ui(context):
+    """ An imgui context with its font texture uploaded, yields a function building a frame. """
+    imgui_context = imgui.create_context()
+    io = imgui.get_io()
+    io.display_size = (WIDTH, HEIGHT)
+    io.ini_file_name = None
+
+    width, height, pixels = io.fonts.get_tex_data_as_rgba32()
+    font_texture = gl.glGenTextures(1)
+    gl.glBindTexture(gl.GL_TEXTURE_2D, font_texture)
+    gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
+    gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
+    gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA, width, height, 0,
+                    gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, pixels)
+    gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
+    io.fonts.texture_id = font_texture
+
+    def frame(text: str = "Time"):
+        imgui.new_frame()
+        imgui.set_next_window_position(0, 0)
+        imgui.begin("Headless")
+        imgui.text(text)
+        imgui.end()
+        imgui.render()
+        return imgui.get_draw_data()
+
+    # A new window takes a couple of frames to measure itself and settle
+    for _ in range(2):
+        frame()
+    yield frame
+
+    imgui.destroy_context(imgui_context)
+    gl.glDeleteTextures([font_texture])
+
+
+def begin_ui(state):
+    state.begin()
+    state.enable(gl.GL_BLEND)
+    state.blend_equation(gl.GL_FUNC_ADD)
+    state.blend_func(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+    state.disable(gl.GL_CULL_FACE)
+    state.disable(gl.GL_DEPTH_TEST)
+    state.enable(gl.GL_SCISSOR_TEST)
+    state.active_texture(gl.GL_TEXTURE0)
+    state.viewport(0, 0, WIDTH, HEIGHT)
+
+
+def read_pixels() -> bytes:
+    gl.glFinish()
+    return gl.glReadPixels(0, 0, WIDTH, HEIGHT, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE)
+
+
+def clear():
+    gl.glDisable(gl.GL_SCISSOR_TEST)
+    gl.glClearColor(0.0, 0.0, 0.0, 0.0)
+    gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+
+
+def test_stream_pass_draws_through_the_ring(ui):
+    stream = load("stream")
+    assert stream.supports_stream_pipeline()
+
+    stream_pass = stream.ImguiStreamPass(VERTEX_SHADER_SRC, FRAGMENT_SHADER_SRC)
+    stream_pass.create()
+    try:
+        # More frames than ring segments, so the buffers are orphaned at least once
+        for frame in range(stream.RING_SEGMENTS * 2 + 1):
+            clear()
+            draw_data = ui(f"Frame {frame}")
+            begin_ui(stream_pass.state)
+            stream_pass.draw(draw_data, WIDTH, HEIGHT, HEIGHT)
+            stream_pass.state.end()
+
+            assert gl.glGetError() == gl.GL_NO_ERROR
+            assert stream_pass.bytes_uploaded > 0
+            assert any(read_pixels())
+
+        assert stream_pass.stats.draws <= stream_pass.stats.commands
+    finally:
+        stream_pass.destroy()
+
+
+def _command(texture_id: int, clip_rect: tuple, elem_count: int):
+    return types.SimpleNamespace(texture_id=texture_id, clip_rect=clip_rect, elem_count=elem_count)
+
+
+def test_coalesce_commands_merges_adjacent_runs():
+    batch = load("batch")
+    stats = batch.DrawStats()
+    clip = (10.0, 20.0, 50.0, 60.0)
+    other_clip = (0.0, 0.0, 128.0, 96.0)
+    commands = [_command(1, clip, 6), _command(1, clip, 12),   # merged
+                _command(2, clip, 3),                          # texture changes
+                _command(2, other_clip, 6), _command(2, other_clip, 6),  # clip changes, merged
+                _command(1, other_clip, 3)]                    # same texture as the first, not adjacent
+    base = 4096
+    size = imgui.INDEX_SIZE
+
+    draws = batch.coalesce_commands(commands, HEIGHT, base, stats)
+
+    # The scissor box is GL's, counted from the bottom: y = fb_height - clip bottom
+    assert draws == [[1, (10, 36, 40, 40), 18, base],
+                     [2, (10, 36, 40, 40), 3, base + 18 * size],
+                     [2, (0, 0, 128, 96), 12, base + 21 * size],
+                     [1, (0, 0, 128, 96), 3, base + 33 * size]]
+    assert (stats.frame_commands, stats.frame_draws) == (6, 4)
+    assert stats.saved == pytest.approx(1.0 / 3.0)
+
+    # Nothing adjacent shares texture and clip: one draw per command
+    stats.begin_frame()
+    draws = batch.coalesce_commands(
+        [_command(1, clip, 3), _command(2, clip, 3), _command(1, clip, 3)], HEIGHT, 0, stats)
+    assert [draw[3] for draw in draws] == [0, 3 * size, 6 * size]
+    assert (stats.frame_commands, stats.frame_draws) == (3, 3)
+
+
+def _framebuffer():
+    texture = gl.glGenTextures(1)
+    gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+    gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA8, WIDTH, HEIGHT, 0,
+                    gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, None)
+    gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
+
+    framebuffer = gl.glGenFramebuffers(1)
+    gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, framebuffer)
+    gl.glFramebufferTexture2D(gl.GL_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0,
+                              gl.GL_TEXTURE_2D, texture, 0)
+    assert gl.glCheckFramebufferStatus(gl.GL_FRAMEBUFFER) == gl.GL_FRAMEBUFFER_COMPLETE
+    return framebuffer, texture
+
+
+def test_retained_output_composites_into_the_current_framebuffer(ui):
+    stream = load("stream")
+    stream_pass = stream.ImguiStreamPass(VERTEX_SHADER_SRC, FRAGMENT_SHADER_SRC)
+    stream_pass.create()
+    retained = stream.RetainedOutput()
+    targets = [_framebuffer() for _ in range(3)]
+    try:
+        # The host switches framebuffers between frames without the cache seeing it,
+        # the last frame is redrawn offscreen before it's composited
+        for frame, (framebuffer, _) in enumerate(targets):
+            gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, framebuffer)
+            clear()
+            if frame == 2:
+                retained.invalidate()
+
+            begin_ui(stream_pass.state)
+            retained.draw(stream_pass, ui(), WIDTH, HEIGHT, WIDTH, HEIGHT)
+            stream_pass.state.end()
+
+            assert gl.glGetError() == gl.GL_NO_ERROR
+            assert gl.glGetIntegerv(gl.GL_DRAW_FRAMEBUFFER_BINDING) == framebuffer
+            gl.glBindFramebuffer(gl.GL_READ_FRAMEBUFFER, framebuffer)
+            assert any(read_pixels())
+
+        assert retained.misses == 2
+        assert retained.hits == 1
+    finally:
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, 0)
+        for framebuffer, texture in targets:
+            gl.glDeleteFramebuffers(1, [framebuffer])
+            gl.glDeleteTextures([texture])
+        retained.destroy()
+        stream_pass.destroy()
+
+
+def _retained_timer_hits(ui, timer_text) -> tuple[int, int]:
+    """ One second of gameplay at 60 fps with the HUD timer, returns (hits, misses). """
+    stream = load("stream")
+    stream_pass = stream.ImguiStreamPass(VERTEX_SHADER_SRC, FRAGMENT_SHADER_SRC)
+    stream_pass.create()
+    retained = stream.RetainedOutput()
+    framebuffer, texture = _framebuffer()
+    try:
+        for frame in range(60):
+            clear()
+            begin_ui(stream_pass.state)
+            retained.draw(stream_pass, ui(timer_text(12.0 + frame / 60.0)), WIDTH, HEIGHT, WIDTH, HEIGHT)
+            stream_pass.state.end()
+        assert gl.glGetError() == gl.GL_NO_ERROR
+        return retained.hits, retained.misses
+    finally:
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, 0)
+        gl.glDeleteFramebuffers(1, [framebuffer])
+        gl.glDeleteTextures([texture])
+        retained.destroy()
+        stream_pass.destroy()
+
+
+def test_retained_output_hits_with_the_hud_timer(ui):
+    # Formatted like windows.TimerWindow: the text only changes every tenth of a second
+    hits, misses = _retained_timer_hits(ui, lambda time: f"{time:.1f}s")
+    assert misses <= 11
+    assert hits >= 49
+
+    # Unrounded, every frame is new
+    hits, misses = _retained_timer_hits(ui, lambda time: f"{time}s")
+    assert hits == 0
+
+
+def _real(glstate, key):
+    return glstate._functions(key)[0]()
+
+
+def test_state_cache_keeps_host_state_across_passes(context):
+    glstate = load("glstate")
+    state = glstate.GLStateCache(validate_interval=1)
+    keys = ("viewport", ("enable", gl.GL_BLEND), "blend_func", "texture")
+
+    gl.glViewport(0, 0, 64, 48)
+    gl.glDisable(gl.GL_BLEND)
+    gl.glBlendFunc(gl.GL_ONE, gl.GL_ZERO)
+    host = {key: _real(glstate, key) for key in keys}
+
+    begin_ui(state)
+    state.bind_texture(0)
+    state.end()
+    assert state.mismatches == []
+    assert {key: _real(glstate, key) for key in keys} == host
+
+    # A second identical pass is answered from the cache
+    state.validate_interval = 0
+    state.queries = 0
+    begin_ui(state)
+    state.bind_texture(0)
+    state.end()
+    assert state.queries == 0
+    assert {key: _real(glstate, key) for key in keys} == host
+
+    # A resized window changes BGE's viewport, the renderer invalidates the cache for it
+    gl.glViewport(8, 8, 32, 24)
+    state.invalidate()
+    host["viewport"] = _real(glstate, "viewport")
+    begin_ui(state)
+    state.end()
+    assert {key: _real(glstate, key) for key in keys} == host
+    assert state.validate() == []
+
+
+def test_state_cache_validation_catches_untracked_calls(context):
+    glstate = load("glstate")
+    state = glstate.GLStateCache(validate_interval=1)
+    gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
+    texture = gl.glGenTextures(1)
+    try:
+        begin_ui(state)
+        state.bind_texture(0)
+        # Behind the cache's back
+        gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+        state.end()
+
+        assert [key for key, _, _ in state.mismatches] == ["texture"]
+        assert _real(glstate, "texture") == 0
+    finally:
+        gl.glDeleteTextures([texture])
+
+
+def _page_pixel(page, x: int, y: int) -> bytes:
+    gl.glBindTexture(gl.GL_TEXTURE_2D, page.texture)
+    pixels = gl.glGetTexImage(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE)
+    gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
+    offset = (y * page.width + x) * 4
+    return bytes(pixels[offset:offset + 4])
+
+
+@pytest.mark.parametrize("copy_image", [True, False], ids=["copy-image", "blit"])
+def test_atlas_repack_copies_images_on_the_gpu(context, copy_image):
+    atlas_module = load("atlas")
+    atlas = atlas_module.TextureAtlas(page_size=64, max_image_size=32)
+    atlas.copy_image = copy_image
+    size = 14
+    colours = [bytes((index * 15, 255 - index * 15, index, 255)) for index in range(17)]
+    try:
+        # 16 padded 16x16 images fill the page, freeing every other one lets the 17th repack it
+        regions = [atlas.add(colour * (size * size), size, size) for colour in colours[:16]]
+        for region in regions[::2]:
+            atlas.release(region)
+        live = list(zip(regions[1::2], colours[1::2]))
+        before = {region: (region.x, region.y) for region, _ in live}
+
+        live.append((atlas.add(colours[16] * (size * size), size, size), colours[16]))
+
+        assert atlas.repacks == 1
+        assert len(atlas.pages) == 1
+        assert any((region.x, region.y) != spot for region, spot in before.items())
+        for region, colour in live:
+            page = region.page
+            for x, y in ((0, 0), (size + 1, size + 1), (size // 2, size // 2)):
+                assert _page_pixel(page, region.x + x, region.y + y) == colour
+        assert gl.glGetError() == gl.GL_NO_ERROR
+    finally:
+        atlas.destroy()
+
+
+class DecodedImage:
+    """ The parts of ImageHelper the loader uses, decoded and waiting for its upload. """
+
+    def __init__(self) -> None:
+        self.loaded = True
+        self.applied = False
+        self.missing = False
+        self.invalid = False
+        self.applies = 0
+
+    def apply(self):
+        self.applies += 1
+        self.applied = True
+
+
+def test_loader_defers_uploads_until_flushed():
+    loader = load("loader").ImageLoader()
+    image = DecodedImage()
+
+    # texture_id asking on every frame it's shown before the frame ends
+    loader.defer(image)
+    loader.defer(image)
+    assert image.applies == 0
+
+    loader.flush()
+    assert image.applies == 1
+    assert loader.deferred == []
+
+    late = DecodedImage()
+    loader.defer(late)
+    loader.drain()
+    assert late.applies == 1